@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+'''
+Run this script to measure how update-libs.py scales with the size of the bundle zip:
+
+    cd bin
+    python bench-libs.py --sizes 1000 10000 100000 --output bench-libs.json
+
+For each size, a synthetic bundle zip is generated in a temporary directory with that many library
+files, laid out like a real Adafruit release, i.e. under a top-level directory such as
+adafruit-circuitpython-bundle-10.x-mpy-20251231/lib/, with a mix of single-file modules and
+packages. An input zip lists --wanted of those files (plus a few that are missing in the bundle).
+The time taken by each phase is then recorded:
+
+    index        build_bundle_index() on the bundle zip
+    extract      copying the matched files into a temporary directory
+    zip          create_output_zip_from_dir() on that directory
+    stream       stream_matches_to_zip(), which combines the last two phases
+    incremental  incremental_matches_to_zip() against the previous output
+
+Each phase is repeated --repeat times and the fastest time is kept. Results are printed and saved
+as JSON. To compare against a stored baseline, and exit with an error if any phase is more than
+--tolerance times slower:
+
+    python bench-libs.py --baseline
+
+which uses bench-libs-baseline.json next to this script (or pass the path of another baseline).
+Add --update-baseline to save the new results as the baseline instead. The committed baseline was
+measured with the default options on the machine recorded in its "platform", "cpu" and "python"
+fields. Timings depend on the machine, so a comparison is only meaningful on similar hardware:
+on any other computer, first save a baseline of your own, e.g. before changing update-libs.py.
+'''
+import argparse
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# update-libs.py cannot be imported by name because of the hyphen
+_spec = importlib.util.spec_from_file_location("update_libs", Path(__file__).with_name("update-libs.py"))
+update_libs = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(update_libs)
+
+BUNDLE_PREFIX = "adafruit-circuitpython-bundle-10.x-mpy-20251231"
+PACKAGE_FILES = 8  # files per package directory
+PHASES = ("index", "extract", "zip", "stream", "incremental")
+BASELINE_PATH = Path(__file__).with_name("bench-libs-baseline.json")
+
+
+def synthetic_member(rng: random.Random, size: int) -> bytes:
+    # Mix of repeated names and random bytes that compresses about as well as real .mpy files
+    words = [b"adafruit_register", b"i2c_device", b"__init__", b"property", b"self"]
+    buf = io.BytesIO()
+    while buf.tell() < size:
+        if rng.random() < 0.5:
+            buf.write(rng.choice(words))
+        else:
+            buf.write(rng.randbytes(8))
+    return buf.getvalue()[:size]
+
+
+def make_bundle(path: Path, nmembers: int, member_size: int, seed: int = 0) -> List[str]:
+    """
+    Write a synthetic bundle zip with nmembers library files and return their 'lib/' paths.
+    """
+    rng = random.Random(seed)
+    names = []
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for prefix in (BUNDLE_PREFIX + "/", BUNDLE_PREFIX + "/examples/"):
+            z.writestr(zipfile.ZipInfo(prefix), b"")
+        i = 0
+        while i < nmembers:
+            if rng.random() < 0.3:
+                # A single-file module
+                name = f"lib/adafruit_module{i}.mpy"
+                z.writestr(f"{BUNDLE_PREFIX}/{name}", synthetic_member(rng, member_size))
+                names.append(name)
+                i += 1
+            else:
+                # A package directory
+                for j in range(min(PACKAGE_FILES, nmembers - i)):
+                    name = f"lib/adafruit_package{i}/" + ("__init__.mpy" if j == 0 else f"device{j}.mpy")
+                    z.writestr(f"{BUNDLE_PREFIX}/{name}", synthetic_member(rng, member_size))
+                    names.append(name)
+                i += PACKAGE_FILES
+    return names
+
+
+def make_input(path: Path, names: List[str], nwanted: int, nmissing: int = 3, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    wanted = rng.sample(names, min(nwanted, len(names)))
+    wanted += [f"lib/adafruit_renamed{k}/device.mpy" for k in range(nmissing)]
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for name in wanted:
+            z.writestr(name, b"old version")
+
+
+def best_time(func: Callable[[], None], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def quiet_matches(zin: zipfile.ZipFile, bundle_index: "update_libs.BundleIndex") -> list:
+    # The missing files are deliberate, so hide their warnings
+    stderr, sys.stderr = sys.stderr, io.StringIO()
+    try:
+        return list(update_libs.iter_bundle_matches(zin, bundle_index))
+    finally:
+        sys.stderr = stderr
+
+
+def bench_size(workdir: Path, nmembers: int, nwanted: int, member_size: int, repeat: int) -> Dict[str, float]:
+    bundle_zip = workdir / f"{BUNDLE_PREFIX}-{nmembers}.zip"
+    input_zip = workdir / f"E4S-libraries-9.x-{nmembers}.zip"
+    names = make_bundle(bundle_zip, nmembers, member_size)
+    make_input(input_zip, names, nwanted)
+
+    times: Dict[str, float] = {}
+    with zipfile.ZipFile(input_zip) as zin, zipfile.ZipFile(bundle_zip) as zbundle:
+        times["index"] = best_time(lambda: update_libs.build_bundle_index(zbundle), repeat)
+        bundle_index = update_libs.build_bundle_index(zbundle)
+        matches = quiet_matches(zin, bundle_index)
+
+        out_dir = workdir / f"extract-{nmembers}"
+        times["extract"] = best_time(
+            lambda: update_libs.extract_matches_to_dir(zbundle, iter(matches), out_dir), repeat)
+        times["zip"] = best_time(
+            lambda: update_libs.create_output_zip_from_dir(out_dir, workdir / "from-dir.zip"), repeat)
+
+        output_zip = workdir / f"E4S-libraries-10.x-{nmembers}.zip"
+        times["stream"] = best_time(
+            lambda: update_libs.stream_matches_to_zip(zbundle, iter(matches), output_zip), repeat)
+
+        with zipfile.ZipFile(output_zip) as zprev:
+            times["incremental"] = best_time(
+                lambda: update_libs.incremental_matches_to_zip(
+                    zbundle, iter(matches), workdir / "incremental.zip", [zprev]), repeat)
+
+    return times
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Print the ratio of each phase time to the baseline. Returns False if any exceeds tolerance.
+    """
+    ok = True
+    machine = ("platform", "cpu", "python")
+    if any(results.get(key) != baseline.get(key) for key in machine):
+        print("Warning: the baseline was measured on " + ", ".join(str(baseline.get(key)) for key in machine),
+              file=sys.stderr)
+    for size, times in results["times"].items():
+        base_times = baseline["times"].get(size)
+        if base_times is None:
+            print(f"{size:>8}: not in baseline")
+            continue
+        ratios = []
+        for phase in PHASES:
+            if phase in times and base_times.get(phase):
+                ratio = times[phase] / base_times[phase]
+                flag = " !" if ratio > tolerance else ""
+                ok = ok and ratio <= tolerance
+                ratios.append(f"{phase} x{ratio:.2f}{flag}")
+        print(f"{size:>8}: " + ", ".join(ratios))
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark update-libs.py on synthetic bundle zips.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="numbers of library files in the synthetic bundles")
+    parser.add_argument("--wanted", type=int, default=50, help="number of library files in the input zip")
+    parser.add_argument("--member-size", type=int, default=2048, help="bytes per library file")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions of each phase")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", nargs="?", const=str(BASELINE_PATH),
+                        help=f"JSON results to compare against (default {BASELINE_PATH.name})")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="save the results to the --baseline file instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="maximum allowed ratio of a phase time to its baseline")
+    args = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu": f"{platform.machine()}, {os.cpu_count()} cores",
+        "wanted": args.wanted,
+        "member_size": args.member_size,
+        "times": {},
+    }
+
+    print(f"{'size':>8} " + " ".join(f"{phase:>11}" for phase in PHASES))
+    with tempfile.TemporaryDirectory(prefix="bench-libs-") as workdir:
+        for size in args.sizes:
+            times = bench_size(Path(workdir), size, args.wanted, args.member_size, args.repeat)
+            results["times"][str(size)] = times
+            print(f"{size:>8} " + " ".join(f"{1e3 * times[phase]:>9.1f}ms" for phase in PHASES))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        if args.update_baseline:
+            with open(args.baseline, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Saved baseline {args.baseline}")
+        else:
+            try:
+                with open(args.baseline) as f:
+                    baseline = json.load(f)
+            except FileNotFoundError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                sys.exit(1)
+            if not compare(results, baseline, args.tolerance):
+                print(f"Error: some phases are more than {args.tolerance}x slower than the baseline", file=sys.stderr)
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+'''
+Run this script to check the timing statistics of lib/e4s_scheduler.py on a computer:
+
+    cd bin
+    python check-scheduler.py
+
+Each check runs a Scheduler for a few seconds with FakeSensor tasks, whose reads block for a fixed
+latency like an I2C transfer, then compares the recorded call counts, jitter, overruns and CPU
+shares with the values expected from the periods and latencies. The bounds allow for the timing
+noise of a busy computer, where sleeps occasionally return several ms late, so a few overruns
+(up to MAX_SPURIOUS of the calls) are tolerated where none are expected. A summary of each check
+is printed, and the script exits with an error if any of them failed.
+'''
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+from typing import Callable, List
+
+# e4s_scheduler.py is a CircuitPython library, not an installed package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "lib"))
+import e4s_scheduler  # noqa: E402
+from e4s_scheduler import FakeSensor, Scheduler  # noqa: E402
+
+# Fraction of calls that can overrun because of the computer, rather than the other tasks
+MAX_SPURIOUS = 0.02
+
+
+def run_for(scheduler: Scheduler, duration: float) -> dict:
+    asyncio.run(scheduler.main(duration))
+    return scheduler.stats()
+
+
+def check_independent(duration: float) -> List[str]:
+    """
+    Short tasks that fit easily between each other are called on time, with no overruns.
+    """
+    scheduler = Scheduler()
+    scheduler.add('imu', FakeSensor(0.001).read, period=0.01, deadline=0.008)
+    scheduler.add('pressure', FakeSensor(0.002).read, period=0.05, offset=0.005)
+    stats = run_for(scheduler, duration)
+    problems = []
+    for name, period, latency in (('imu', 0.01, 0.001), ('pressure', 0.05, 0.002)):
+        ncalls, mean, worst, noverruns, nskipped, share = stats[name]
+        expected = duration / period
+        if abs(ncalls - expected) > 0.05 * expected + 2:
+            problems.append(f"{name}: {ncalls} calls, expected {expected:.0f}")
+        if mean > 2:
+            problems.append(f"{name}: mean jitter {mean:.2f}ms is too large")
+        if noverruns + nskipped > MAX_SPURIOUS * ncalls:
+            problems.append(f"{name}: {noverruns} overruns and {nskipped} skipped, expected none")
+        if not 0.5 * latency / period < share < 2 * latency / period + 0.01:
+            problems.append(f"{name}: CPU share {share:.3f}, expected {latency / period:.3f}")
+    return problems
+
+
+def check_blocking(duration: float) -> List[str]:
+    """
+    A slow blocking task delays a fast task beyond its deadline, which is counted.
+    """
+    scheduler = Scheduler()
+    scheduler.add('imu', FakeSensor(0.001).read, period=0.01, deadline=0.005)
+    scheduler.add('oled', FakeSensor(0.03).read, period=0.2, offset=0.002)
+    stats = run_for(scheduler, duration)
+    problems = []
+    ncalls, mean, worst, noverruns, nskipped, share = stats['imu']
+    noled = stats['oled'][0]
+    if worst < 20:
+        problems.append(f"imu: max jitter {worst:.2f}ms, expected most of the 30ms oled latency")
+    if not noled <= noverruns <= 2 * noled + 2:
+        problems.append(f"imu: {noverruns} overruns, expected about one per oled call ({noled})")
+    if nskipped < noled:
+        problems.append(f"imu: {nskipped} skipped, expected at least {noled}")
+    ncalls, mean, worst, noverruns, nskipped, share = stats['oled']
+    if noverruns + nskipped > MAX_SPURIOUS * ncalls:
+        problems.append(f"oled: {noverruns} overruns and {nskipped} skipped, expected none")
+    if not 0.1 < share < 0.2:
+        problems.append(f"oled: CPU share {share:.3f}, expected 0.150")
+    return problems
+
+
+def check_async(duration: float) -> List[str]:
+    """
+    An async task only counts the time between its awaits as busy, and lets other tasks run
+    while it waits.
+    """
+    sensor = FakeSensor(0.001)
+
+    async def read_multispec():
+        await asyncio.sleep(0.05)
+        return sensor.read()
+
+    scheduler = Scheduler()
+    scheduler.add('multispec', read_multispec, period=0.2, deadline=0.1)
+    scheduler.add('imu', FakeSensor(0.001).read, period=0.01, deadline=0.008, offset=0.003)
+    stats = run_for(scheduler, duration)
+    problems = []
+    ncalls, mean, worst, noverruns, nskipped, share = stats['multispec']
+    expected = duration / 0.2
+    if abs(ncalls - expected) > 0.05 * expected + 1:
+        problems.append(f"multispec: {ncalls} calls, expected {expected:.0f}")
+    if noverruns > MAX_SPURIOUS * ncalls:
+        problems.append(f"multispec: {noverruns} overruns, expected none")
+    if share > 0.02:
+        problems.append(f"multispec: CPU share {share:.3f} includes its awaits, expected 0.005")
+    ncalls, mean, worst, noverruns, nskipped, share = stats['imu']
+    if noverruns > MAX_SPURIOUS * ncalls or mean > 2:
+        problems.append(f"imu: {noverruns} overruns, mean jitter {mean:.2f}ms while multispec waits")
+    return problems
+
+
+CHECKS: List[Callable[[float], List[str]]] = [check_independent, check_blocking, check_async]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check the timing statistics of e4s_scheduler with fake sensors.")
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds to run each check")
+    args = parser.parse_args()
+
+    nfailed = 0
+    for check in CHECKS:
+        problems = check(args.duration)
+        print(f"{check.__name__}: {'FAILED' if problems else 'ok'}")
+        for problem in problems:
+            print(f"Error: {problem}", file=sys.stderr)
+        nfailed += bool(problems)
+    print(f"{len(CHECKS) - nfailed}/{len(CHECKS)} checks passed using {e4s_scheduler.__file__}")
+    if nfailed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+'''
+Run this script to check how sync-libs.py and provision.py update the lib/ folder of a CIRCUITPY
+drive, on a computer:
+
+    cd bin
+    python check-sync.py
+
+Each check builds library zips and a fake CIRCUITPY drive in a temporary directory, with files
+that are new, changed (including a change that keeps the same size, so only the CRC32 tells it
+apart), unchanged, left over from a previous sync, or copied by hand. The plan of each sync and
+the files left on the drive are then compared with what is expected. provision.py is run on
+several such drives at once, with a code.py. A summary is printed, and the script exits with an
+error if any check failed.
+'''
+import importlib.util
+import subprocess
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# sync-libs.py cannot be imported by name because of the hyphen
+_spec = importlib.util.spec_from_file_location("sync_libs", Path(__file__).with_name("sync-libs.py"))
+sync_libs = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(sync_libs)
+
+# Library files of the zip used for the first sync, and of the updated zip
+OLD_LIBS = {
+    "lib/adafruit_ticks.mpy": b"ticks v1",
+    "lib/adafruit_display_text/label.mpy": b"label",
+    "lib/adafruit_display_text/bitmap_label.mpy": b"bitmap label",
+    "lib/adafruit_hcsr04.mpy": b"hcsr04",
+}
+NEW_LIBS = {
+    "lib/adafruit_ticks.mpy": b"ticks v2",  # same size, different CRC32
+    "lib/adafruit_display_text/label.mpy": b"label, longer",
+    "lib/adafruit_display_text/bitmap_label.mpy": b"bitmap label",
+    "lib/adafruit_dps310/basic.mpy": b"dps310",
+}
+# Files copied to the drive by hand, which are never deleted
+HAND_COPIED = {
+    "lib/e4s_capture.py": b"# helper",
+    "lib/adafruit_display_text/custom.py": b"# local change",
+}
+
+
+def write_zip(path: Path, files: Dict[str, bytes]) -> Path:
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zout:
+        for name, data in files.items():
+            zout.writestr(name, data)
+    return path
+
+
+def write_files(target: Path, files: Dict[str, bytes]) -> None:
+    for name, data in files.items():
+        path = target / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+
+
+def read_tree(target: Path) -> Dict[str, bytes]:
+    return {name: (target / name).read_bytes() for name in sync_libs.target_files(target)}
+
+
+def sync(libs_zip: Path, target: Path, delete: bool = True) -> sync_libs.SyncPlan:
+    with zipfile.ZipFile(libs_zip, "r") as zlib_file:
+        members = sync_libs.lib_members(zlib_file)
+        plan = sync_libs.plan_sync(members, target, sync_libs.read_manifest(target))
+        sync_libs.apply_sync(zlib_file, members, plan, target, delete)
+    return plan
+
+
+def compare_plan(plan: sync_libs.SyncPlan, **expected: List[str]) -> List[str]:
+    problems = []
+    for field in sync_libs.SyncPlan._fields:
+        got, want = getattr(plan, field), sorted(expected.get(field, []))
+        if got != want:
+            problems.append(f"{field}: {got}, expected {want}")
+    return problems
+
+
+def compare_tree(target: Path, expected: Dict[str, bytes]) -> List[str]:
+    tree = read_tree(target)
+    problems = [f"missing {name}" for name in sorted(set(expected) - set(tree))]
+    problems += [f"unexpected {name}" for name in sorted(set(tree) - set(expected))]
+    problems += [f"differs {name}" for name in sorted(set(tree) & set(expected)) if tree[name] != expected[name]]
+    return problems
+
+
+def check_update(tmpdir: Path) -> List[str]:
+    """
+    Files from the first sync that are missing in the updated zip are deleted, but files
+    copied by hand are kept.
+    """
+    target = tmpdir / "CIRCUITPY"
+    target.mkdir()
+    problems = compare_plan(sync(write_zip(tmpdir / "old.zip", OLD_LIBS), target), new=list(OLD_LIBS))
+    write_files(target, HAND_COPIED)
+    plan = sync(write_zip(tmpdir / "new.zip", NEW_LIBS), target)
+    problems += compare_plan(
+        plan, new=["lib/adafruit_dps310/basic.mpy"],
+        changed=["lib/adafruit_ticks.mpy", "lib/adafruit_display_text/label.mpy"],
+        stale=["lib/adafruit_hcsr04.mpy"], unchanged=["lib/adafruit_display_text/bitmap_label.mpy"],
+        unmanaged=list(HAND_COPIED))
+    problems += compare_tree(target, {**NEW_LIBS, **HAND_COPIED})
+    if sync_libs.read_manifest(target) != set(NEW_LIBS):
+        problems.append(f"manifest {sorted(sync_libs.read_manifest(target))}, expected {sorted(NEW_LIBS)}")
+    # A second sync has nothing left to do
+    problems += compare_plan(sync(tmpdir / "new.zip", target), unchanged=list(NEW_LIBS), unmanaged=list(HAND_COPIED))
+    return problems
+
+
+def check_keep(tmpdir: Path) -> List[str]:
+    """
+    With --keep, stale files stay on the drive but remain in the manifest, so a later sync
+    without --keep still deletes them, and empty directories are removed.
+    """
+    target = tmpdir / "CIRCUITPY"
+    target.mkdir()
+    old = {**OLD_LIBS, "lib/adafruit_lis3dh/old.mpy": b"lis3dh"}
+    sync(write_zip(tmpdir / "old.zip", old), target)
+    new_zip = write_zip(tmpdir / "new.zip", NEW_LIBS)
+    sync(new_zip, target, delete=False)
+    stale = ["lib/adafruit_hcsr04.mpy", "lib/adafruit_lis3dh/old.mpy"]
+    problems = compare_tree(target, {**NEW_LIBS, **{name: old[name] for name in stale}})
+    problems += compare_plan(sync(new_zip, target), stale=stale, unchanged=list(NEW_LIBS))
+    problems += compare_tree(target, NEW_LIBS)
+    if (target / "lib" / "adafruit_lis3dh").exists():
+        problems.append("empty directory lib/adafruit_lis3dh was not removed")
+    return problems
+
+
+def check_command(tmpdir: Path) -> List[str]:
+    """
+    sync-libs.py --dry-run leaves the drive untouched. Without a manifest from a previous sync,
+    a real run then updates the library files but deletes nothing.
+    """
+    target = tmpdir / "CIRCUITPY"
+    target.mkdir()
+    before = {**OLD_LIBS, **HAND_COPIED}
+    write_files(target, before)
+    new_zip = write_zip(tmpdir / "new.zip", NEW_LIBS)
+    script = str(Path(__file__).with_name("sync-libs.py"))
+    problems = []
+    for args, expected in ((["--dry-run"], before), ([], {**before, **NEW_LIBS})):
+        result = subprocess.run([sys.executable, script, str(new_zip), str(target)] + args,
+                                capture_output=True, text=True)
+        if result.returncode:
+            return [f"sync-libs.py {' '.join(args)} failed: {result.stderr.strip()}"]
+        label = " ".join(args) or "sync"
+        problems += [f"{label}: {problem}" for problem in compare_tree(target, expected)]
+        if "0 deleted, 3 kept" not in result.stdout:
+            problems.append(f"{label}: summary {result.stdout.strip()!r}, expected 0 deleted, 3 kept")
+    return problems
+
+
+def check_provision(tmpdir: Path) -> List[str]:
+    """
+    provision.py updates a fresh drive and a drive from a previous sync the same way as
+    sync-libs.py, writes code.py on both, and reports an unreadable --targets-file.
+    """
+    fresh, synced = tmpdir / "CIRCUITPY1", tmpdir / "CIRCUITPY2"
+    fresh.mkdir()
+    synced.mkdir()
+    sync(write_zip(tmpdir / "old.zip", OLD_LIBS), synced)
+    write_files(synced, {**HAND_COPIED, "code.py": b"print('old')"})
+    new_zip = write_zip(tmpdir / "new.zip", NEW_LIBS)
+    code = tmpdir / "hello.py"
+    code.write_bytes(b"print('hello')")
+    targets_file = tmpdir / "targets.txt"
+    targets_file.write_text(f"{synced}\n\n")
+    script = str(Path(__file__).with_name("provision.py"))
+    result = subprocess.run([sys.executable, script, str(new_zip), str(code), str(fresh),
+                             "--targets-file", str(targets_file), "--jobs", "2"], capture_output=True, text=True)
+    if result.returncode:
+        return [f"provision.py failed: {result.stderr.strip()}"]
+    problems = []
+    for target, expected in ((fresh, NEW_LIBS), (synced, {**NEW_LIBS, **HAND_COPIED})):
+        problems += [f"{target.name}: {problem}" for problem in compare_tree(target, expected)]
+        if (target / "code.py").read_bytes() != code.read_bytes():
+            problems.append(f"{target.name}: code.py differs")
+        if sync_libs.read_manifest(target) != set(NEW_LIBS):
+            problems.append(f"{target.name}: manifest {sorted(sync_libs.read_manifest(target))}")
+    # A directory cannot be read as a targets file
+    result = subprocess.run([sys.executable, script, str(new_zip), str(code), "--targets-file", str(tmpdir)],
+                            capture_output=True, text=True)
+    if result.returncode != 1 or not result.stderr.startswith("Error:"):
+        problems.append(f"unreadable --targets-file: exit {result.returncode}, {result.stderr.strip()!r}")
+    return problems
+
+
+CHECKS: List[Callable[[Path], List[str]]] = [check_update, check_keep, check_command, check_provision]
+
+
+def main() -> None:
+    nfailed = 0
+    for check in CHECKS:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            problems = check(Path(tmpdir))
+        print(f"{check.__name__}: {'FAILED' if problems else 'ok'}")
+        for problem in problems:
+            print(f"Error: {problem}", file=sys.stderr)
+        nfailed += bool(problems)
+    print(f"{len(CHECKS) - nfailed}/{len(CHECKS)} checks passed")
+    if nfailed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
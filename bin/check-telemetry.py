@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+'''
+Run this script to check that frames written by lib/e4s_telemetry.py are decoded correctly by
+read-telemetry.py, on a computer:
+
+    cd bin
+    python check-telemetry.py
+
+Arrays of every typecode, as array.array, numpy arrays and bytes, are written by a Telemetry into
+an in-memory stream, together with a corrupted frame, a dropped frame and some junk bytes. The
+stream is then fed to a FrameDecoder in chunks of random sizes, and the decoded arrays, channels
+and counts of bad and lost frames are compared with what was sent. Finally, the same frames are
+piped through read-telemetry.py itself and its --output file is compared. A summary is printed,
+and the script exits with an error if any check failed.
+'''
+import array
+import importlib.util
+import io
+import random
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+# read-telemetry.py cannot be imported by name because of the hyphen
+_spec = importlib.util.spec_from_file_location("read_telemetry", Path(__file__).with_name("read-telemetry.py"))
+read_telemetry = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(read_telemetry)
+
+# e4s_telemetry.py is a CircuitPython library, not an installed package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "lib"))
+from e4s_telemetry import Telemetry  # noqa: E402
+
+
+def sample_arrays() -> List[object]:
+    """
+    Return arrays of every supported typecode, including the platform-dependent 'l' and 'L'.
+    """
+    values = [0, 1, 100, 127]
+    arrays = [array.array(code, values) for code in 'bBhHiIlLqQ']
+    arrays += [array.array('f', [0.5, -1.25]), array.array('d', [1e-300, 3.5])]
+    arrays += [np.arange(-3, 3, dtype=np.int64), np.arange(5, dtype=np.uint32),
+               np.linspace(0, 1, 7, dtype=np.float32), np.linspace(0, 1, 9), bytes(range(10))]
+    return arrays
+
+
+def as_numpy(data: object) -> np.ndarray:
+    if isinstance(data, bytes):
+        return np.frombuffer(data, dtype=np.uint8)
+    return np.asarray(data)
+
+
+def encode(arrays: List[object]) -> Tuple[bytes, List[Tuple[int, object]]]:
+    """
+    Write each array as a frame, then damage the stream. Returns the stream and the
+    (channel, array) of the frames that should be decoded.
+    """
+    stream = io.BytesIO()
+    telemetry = Telemetry(stream)
+    expected = []
+    for i, data in enumerate(arrays):
+        start = stream.tell()
+        telemetry.write_frame(data, channel=i % 3)
+        if i == 3:
+            # Corrupt one data byte, so the frame has a bad checksum.
+            stream.seek(start + read_telemetry.HEADER.size)
+            stream.write(b'\xff')
+            stream.seek(0, io.SEEK_END)
+        elif i == 6:
+            # Drop the whole frame, as if it was lost.
+            stream.seek(start)
+            stream.truncate()
+        else:
+            expected.append((i % 3, data))
+        if i == 8:
+            stream.write(b'junk E')
+    return stream.getvalue(), expected
+
+
+def compare(frames: List[Tuple[int, np.ndarray]], expected: List[Tuple[int, object]]) -> List[str]:
+    problems = []
+    if len(frames) != len(expected):
+        return [f"decoded {len(frames)} frames, expected {len(expected)}"]
+    for i, ((channel, values), (want_channel, data)) in enumerate(zip(frames, expected)):
+        want = as_numpy(data)
+        if channel != want_channel:
+            problems.append(f"frame {i}: channel {channel}, expected {want_channel}")
+        if values.dtype.itemsize != want.dtype.itemsize or values.dtype.kind != want.dtype.kind:
+            problems.append(f"frame {i}: dtype {values.dtype}, expected {want.dtype}")
+        elif not np.array_equal(values, want):
+            problems.append(f"frame {i}: values {values}, expected {want}")
+    return problems
+
+
+def check_decoder(stream: bytes, expected: List[Tuple[int, object]]) -> List[str]:
+    decoder = read_telemetry.FrameDecoder()
+    frames = []
+    pos = 0
+    rng = random.Random(1)
+    while pos < len(stream):
+        size = rng.randint(1, 40)
+        frames += decoder.feed(stream[pos:pos + size])
+        pos += size
+    problems = compare(frames, expected)
+    if decoder.nbad != 1:
+        problems.append(f"{decoder.nbad} bad frames, expected 1")
+    # The corrupted frame and the dropped frame are both missing from the sequence.
+    if decoder.nlost != 2:
+        problems.append(f"{decoder.nlost} lost frames, expected 2")
+    return problems
+
+
+def check_pipe(stream: bytes, expected: List[Tuple[int, object]]) -> List[str]:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output = Path(tmpdir) / "frames.npz"
+        result = subprocess.run(
+            [sys.executable, str(Path(__file__).with_name("read-telemetry.py")), "-", "--output", str(output)],
+            input=stream, capture_output=True)
+        if result.returncode:
+            return [f"read-telemetry.py failed: {result.stderr.decode().strip()}"]
+        with np.load(output) as saved:
+            problems = []
+            for channel in range(3):
+                # Arrays of different dtypes are concatenated with numpy's type promotion.
+                want = [as_numpy(data) for c, data in expected if c == channel]
+                got = saved[f"channel{channel}"]
+                if not np.array_equal(got, np.concatenate(want)):
+                    problems.append(f"channel{channel} of --output differs")
+    return problems
+
+
+def main() -> None:
+    stream, expected = encode(sample_arrays())
+    nfailed = 0
+    for name, check in (("decoder", check_decoder), ("pipe", check_pipe)):
+        problems = check(stream, expected)
+        print(f"{name}: {'FAILED' if problems else 'ok'}")
+        for problem in problems:
+            print(f"Error: {problem}", file=sys.stderr)
+        nfailed += bool(problems)
+    print(f"{2 - nfailed}/2 checks passed with {len(expected)} frames in {len(stream)} bytes")
+    if nfailed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+'''
+Run this script to generate a minimal lib/ zip file for each of one or more CircuitPython scripts:
+
+    cd bin
+    python minimal-libs.py <libs.zip> <script.py> [<script.py> ...]
+
+where <libs.zip> is an E4S-libraries-<version>.zip file generated by update-libs.py. The imports of
+each script are found by parsing its source, then resolved to files under 'lib/' in <libs.zip>.
+The dependencies of those library files are added recursively, by reading the qstr (interned string)
+table at the start of each .mpy file, which lists every module name the compiled code can import,
+or by parsing the source of .py library files. Enclosing package __init__ files are always included.
+
+For each script, a zip file named <script>-lib.zip is written to the current directory (or the
+directory given with --output-dir), containing only the library files that script needs, and a
+report of the number of files and bytes compared with the full <libs.zip> is printed, e.g.
+
+    python minimal-libs.py E4S-libraries-10.x.zip ../hello/hello_imu.py ../hello/hello_sonar.py
+
+The report also lists the modules imported by the script, or by any library file it needs, that
+are not in <libs.zip>. Most are built into the firmware, like board or time, but a library listed
+there is missing from the zip. Since the qstrs of an .mpy file do not tell module names apart from
+other strings, only names starting with one of LIBRARY_PREFIXES are checked for .mpy files.
+
+Copy the lib/ folder inside <script>-lib.zip to your CIRCUITPY drive instead of the full library set.
+'''
+import argparse
+import ast
+import importlib.util
+import os
+import sys
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import Iterable, List, Optional, Set, Tuple
+
+# update-libs.py cannot be imported by name because of the hyphen
+_spec = importlib.util.spec_from_file_location("update_libs", Path(__file__).with_name("update-libs.py"))
+update_libs = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(update_libs)
+
+# First byte of .mpy files: 'M' for MicroPython, 'C' for CircuitPython
+MPY_MAGIC = (b"M", b"C")
+# Oldest .mpy version with the qstr table at the start of the file (MicroPython 1.19, CircuitPython 8)
+MPY_MIN_VERSION = 6
+
+SOURCE_SUFFIXES = (".mpy", ".py")
+
+# Prefixes of library module names. Any qstr of an .mpy file with one of these prefixes that is not
+# in the zip is reported as missing, since the qstrs alone do not tell module names apart.
+LIBRARY_PREFIXES = ("adafruit_", "circuitpython_")
+
+
+def read_vuint(data: bytes, pos: int) -> Tuple[int, int]:
+    """
+    Decode a variable-length unsigned int (7 bits per byte, most significant first) at data[pos].
+    Returns the value and the position after it.
+    """
+    value = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        value = (value << 7) | (b & 0x7F)
+        if not b & 0x80:
+            return value, pos
+
+
+def mpy_qstrs(data: bytes) -> List[str]:
+    """
+    Return the strings in the qstr table of a compiled .mpy file. Static qstrs, which refer to
+    names built into the firmware, are not stored in the file and are omitted.
+    """
+    if len(data) < 4 or data[:1] not in MPY_MAGIC:
+        raise ValueError("not an .mpy file")
+    if data[1] < MPY_MIN_VERSION:
+        raise ValueError(f"unsupported .mpy version {data[1]}")
+
+    n_qstr, pos = read_vuint(data, 4)
+    _, pos = read_vuint(data, pos)  # number of constant objects
+
+    out = []
+    for _ in range(n_qstr):
+        n, pos = read_vuint(data, pos)
+        if n & 1:
+            # Index into the static qstr table
+            continue
+        n >>= 1
+        out.append(data[pos:pos + n].decode("utf-8", errors="replace"))
+        pos += n + 1  # skip the terminating null
+    return out
+
+
+def source_imports(source: str, filename: str = "<source>") -> Tuple[Set[str], Set[str]]:
+    """
+    Return the absolute module names imported by Python source, and the names imported
+    relative to its own package (without the leading dots).
+    For 'from a import b', both 'a' and 'a.b' are returned since b might be a submodule.
+    """
+    absolute: Set[str] = set()
+    relative: Set[str] = set()
+    for node in ast.walk(ast.parse(source, filename)):
+        if isinstance(node, ast.Import):
+            absolute.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            names = absolute if node.level == 0 else relative
+            base = node.module or ""
+            if base:
+                names.add(base)
+            for alias in node.names:
+                if alias.name != "*":
+                    names.add(f"{base}.{alias.name}" if base else alias.name)
+    return absolute, relative
+
+
+def module_files(lib_names: Set[str], module: str, package: str = "lib") -> List[str]:
+    """
+    Return the files under package needed to import module: the __init__ of each enclosing package,
+    then the module itself. Returns an empty list if the module is not found (e.g. a built-in module).
+    """
+    parts = module.split(".")
+    if not all(parts):
+        return []
+
+    out = []
+    for i in range(1, len(parts) + 1):
+        base = "/".join([package] + parts[:i])
+        candidates = [base + "/__init__" + suffix for suffix in SOURCE_SUFFIXES]
+        if i == len(parts):
+            candidates = [base + suffix for suffix in SOURCE_SUFFIXES] + candidates
+        found = next((c for c in candidates if c in lib_names), None)
+        if found is not None:
+            out.append(found)
+        elif i == len(parts) or not any(c.startswith(base + "/") for c in lib_names):
+            return []
+    return out
+
+
+def top_level_names(lib_names: Set[str]) -> Set[str]:
+    """
+    Return the top-level module and package names of the files under 'lib/'.
+    """
+    out = set()
+    for name in lib_names:
+        parts = PurePosixPath(name).parts
+        out.add(parts[1] if len(parts) > 2 else PurePosixPath(parts[1]).stem)
+    return out
+
+
+def file_dependencies(zf: zipfile.ZipFile, lib_names: Set[str], name: str,
+                      missing: Optional[Set[str]] = None) -> Set[str]:
+    """
+    Return the library files directly imported by the library file name.
+    The top-level names of imports that are not in the zip are added to missing, when provided.
+    """
+    data = zf.read(name)
+    package = PurePosixPath(name).parent.as_posix()
+
+    if name.endswith(".py"):
+        absolute, relative = source_imports(data.decode("utf-8"), name)
+        imported = absolute
+    else:
+        # Any qstr might be a module name, since IMPORT_NAME and IMPORT_FROM take qstr arguments.
+        # Checking every one against the zip contents over-includes rarely, and never misses an import.
+        absolute = set(mpy_qstrs(data))
+        relative = set(absolute)
+        # 'from pkg import mod' stores 'pkg' and 'mod' as separate qstrs
+        for pkg in list(absolute):
+            if module_files(lib_names, pkg):
+                absolute.update(f"{pkg}.{q}" for q in relative)
+        # Other qstrs with a library prefix include source file names like 'adafruit_lsm6ds/lsm6ds3'
+        imported = {q for q in relative if q.startswith(LIBRARY_PREFIXES)
+                    and all(part.isidentifier() for part in q.split("."))}
+
+    if missing is not None:
+        tops = top_level_names(lib_names)
+        missing.update(m.split(".")[0] for m in imported if m.split(".")[0] not in tops)
+
+    out: Set[str] = set()
+    for module in absolute:
+        out.update(module_files(lib_names, module))
+    for module in relative:
+        out.update(module_files(lib_names, module, package))
+    out.discard(name)
+    return out
+
+
+def dependency_closure(zf: zipfile.ZipFile, lib_names: Set[str], modules: Iterable[str],
+                       missing: Optional[Set[str]] = None) -> Set[str]:
+    """
+    Return all library files needed to import modules, including transitive dependencies.
+    The top-level names of modules, or of their dependencies, that are not in the zip (e.g.
+    built-in modules or libraries missing from the zip) are added to missing, when provided.
+    """
+    todo: List[str] = []
+    tops = top_level_names(lib_names)
+    for module in modules:
+        todo.extend(module_files(lib_names, module))
+        if missing is not None and module.split(".")[0] not in tops:
+            missing.add(module.split(".")[0])
+
+    needed: Set[str] = set()
+    while todo:
+        name = todo.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        try:
+            todo.extend(file_dependencies(zf, lib_names, name, missing) - needed)
+        except (SyntaxError, UnicodeDecodeError, ValueError, IndexError) as e:
+            print(f"Warning: could not read imports of '{name}': {e}", file=sys.stderr)
+    return needed
+
+
+def write_minimal_zip(zf: zipfile.ZipFile, names: Iterable[str], output_zip_path: Path) -> None:
+    """
+    Copy the named members of zf into output_zip_path without recompressing them.
+    """
+    with zipfile.ZipFile(output_zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zout:
+        for name in sorted(names):
+            info = zf.getinfo(name)
+            if update_libs.can_raw_copy(info):
+                update_libs.raw_copy_member(zf, info, zout, name)
+            else:
+                update_libs.stream_member(zf, info, zout, name)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Generate a minimal lib/ zip file with only the libraries needed by each script.")
+    parser.add_argument("libs_zip", help="E4S-libraries-<version>.zip with all library files")
+    parser.add_argument("scripts", nargs="+", help="CircuitPython scripts to scan for imports")
+    parser.add_argument("--output-dir", default=".", help="directory for the <script>-lib.zip files")
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir)
+
+    try:
+        zf = zipfile.ZipFile(args.libs_zip, "r")
+    except FileNotFoundError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except zipfile.BadZipFile as e:
+        print(f"Error: bad zip file: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    with zf:
+        lib_infos = {
+            info.filename: info for info in zf.infolist()
+            if not info.is_dir() and info.filename.startswith("lib/")
+            and not update_libs.is_macos_junk(info.filename)}
+        lib_names = set(lib_infos)
+        full_bytes = sum(info.file_size for info in lib_infos.values())
+
+        print(f"{'script':<24} {'files':>5} {'bytes':>8} {'full':>6}  not in {os.path.basename(args.libs_zip)}")
+        for script in args.scripts:
+            try:
+                with open(script) as f:
+                    modules, _ = source_imports(f.read(), script)
+            except (OSError, SyntaxError) as e:
+                print(f"Error: cannot scan '{script}': {e}", file=sys.stderr)
+                continue
+
+            missing: Set[str] = set()
+            needed = dependency_closure(zf, lib_names, modules, missing)
+
+            output_zip_path = output_dir / f"{Path(script).stem}-lib.zip"
+            try:
+                write_minimal_zip(zf, needed, output_zip_path)
+            except OSError as e:
+                print(f"Error: failed creating output zip '{output_zip_path}': {e}", file=sys.stderr)
+                continue
+
+            nbytes = sum(lib_infos[name].file_size for name in needed)
+            fraction = 100 * nbytes / full_bytes if full_bytes else 0
+            print(f"{Path(script).name:<24} {len(needed):>5} {nbytes:>8} {fraction:>5.1f}%  {', '.join(sorted(missing))}")
+
+
+if __name__ == "__main__":
+    main()
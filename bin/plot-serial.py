@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+'''
+Run this script to plot the tuples printed by a board, like the Mu plotter but much faster:
+
+    cd bin
+    python plot-serial.py <port>
+
+where <port> is the board's console serial port (e.g. /dev/ttyACM0 on linux,
+/dev/cu.usbmodem...1 on macOS or COM3 on Windows), or any file, pty or '-' for stdin. Every line
+printed as a tuple of numbers, e.g. print((x, y)) in joystick_xy.py or print((distance,)) in
+hello_sonar.py, adds one point to each of the plotted lines. Other lines are ignored.
+
+Lines are read in a background thread and parsed in batches: the tuples of all complete lines
+read so far are joined into one string and converted with a single call to np.fromstring, and the
+resulting rows are copied into a ring buffer of the most recent --history points. The number of
+values per line is the most common one among the first NCONFIRM tuple lines, which are held until
+then, so that a partial line read just after the port is opened does not decide it. Only lines
+with that number of values are kept; other tuple lines, e.g. two lines merged after the board's
+output buffer overflowed, or a line that cannot be parsed, are counted as dropped. The plot is redrawn about --fps times per second with matplotlib blitting, which only
+redraws the lines, and each line is decimated to at most --max-points points, keeping the minimum
+and maximum of each block of points so that short spikes remain visible. The y axis is rescaled
+when the data goes out of range.
+
+The measured line rate, number of points and number of dropped lines are shown in the corner
+of the plot, and printed every second with --no-plot, which does not need matplotlib.
+'''
+import argparse
+import importlib.util
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+# read-telemetry.py cannot be imported by name because of the hyphen
+_spec = importlib.util.spec_from_file_location("read_telemetry", Path(__file__).with_name("read-telemetry.py"))
+read_telemetry = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(read_telemetry)
+
+RATE_INTERVAL = 1.0  # seconds
+# Number of tuple lines used to choose the number of values per line
+NCONFIRM = 5
+
+
+class LineParser:
+    """
+    Parse tuple lines from a stream of bytes passed to feed() in chunks of any size.
+    """
+
+    def __init__(self):
+        self.partial = b''
+        self.pending: List[bytes] = []  # tuples held until ncols is chosen
+        self.ncols = 0  # set once NCONFIRM tuples have been read
+        self.nlines = 0  # tuple lines kept
+        self.ndropped = 0  # tuple lines that were malformed or had the wrong number of values
+        self.nother = 0  # lines that are not tuples
+
+    def feed(self, data: bytes) -> np.ndarray:
+        """
+        Add data and return the values of the complete tuple lines as an array of shape (n, ncols).
+        """
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        return self._parse(lines)
+
+    def flush(self) -> np.ndarray:
+        """
+        Return the values of the last line, even without a newline, and of any tuple lines
+        still held to choose ncols, at the end of the stream.
+        """
+        lines, self.partial = [self.partial], b''
+        return self._parse(lines, final=True)
+
+    def _parse(self, lines: List[bytes], final: bool = False) -> np.ndarray:
+        tuples = []
+        for line in lines:
+            line = line.strip()
+            if line.startswith(b'(') and line.endswith(b')'):
+                # Remove the parentheses and the trailing comma of a single value.
+                tuples.append(line[1:-1].rstrip(b','))
+            elif line:
+                self.nother += 1
+        if not self.ncols:
+            self.pending += tuples
+            if not self.pending or (len(self.pending) < NCONFIRM and not final):
+                return np.empty((0, 0))
+            # Earlier tuples win ties
+            ncomma, _ = Counter(t.count(b',') for t in self.pending).most_common(1)[0]
+            self.ncols = ncomma + 1
+            tuples, self.pending = self.pending, []
+        if not tuples:
+            return np.empty((0, self.ncols))
+        ncomma = self.ncols - 1
+        good = [t for t in tuples if t.count(b',') == ncomma]
+        self.ndropped += len(tuples) - len(good)
+        try:
+            values = np.fromstring(b','.join(good), sep=',') if good else np.empty(0)
+        except ValueError:
+            values = None
+        if values is None or len(values) != len(good) * self.ncols:
+            # At least one value could not be parsed, so parse each line separately.
+            rows = []
+            for t in good:
+                try:
+                    row = np.fromstring(t, sep=',')
+                except ValueError:
+                    continue
+                if len(row) == self.ncols:
+                    rows.append(row)
+            self.ndropped += len(good) - len(rows)
+            values = np.concatenate(rows) if rows else np.empty(0)
+        values = values.reshape(-1, self.ncols)
+        self.nlines += len(values)
+        return values
+
+
+class RingBuffer:
+    """
+    Keep the most recent capacity rows of ncols values.
+    """
+
+    def __init__(self, capacity: int, ncols: int):
+        self.data = np.zeros((capacity, ncols))
+        self.capacity = capacity
+        self.pos = 0  # next row to write
+        self.total = 0  # rows written so far
+
+    def extend(self, rows: np.ndarray) -> None:
+        n = len(rows)
+        if n >= self.capacity:
+            self.data[:] = rows[-self.capacity:]
+            self.pos = 0
+        else:
+            first = min(n, self.capacity - self.pos)
+            self.data[self.pos:self.pos + first] = rows[:first]
+            self.data[:n - first] = rows[first:]
+            self.pos = (self.pos + n) % self.capacity
+        self.total += n
+
+    def latest(self) -> np.ndarray:
+        """
+        Return a copy of the rows in the buffer, oldest first.
+        """
+        if self.total < self.capacity:
+            return self.data[:self.total].copy()
+        return np.concatenate((self.data[self.pos:], self.data[:self.pos]))
+
+
+def decimate(x: np.ndarray, y: np.ndarray, max_points: int):
+    """
+    Return at most max_points (x, y) points keeping the min and max y of each block of points.
+    """
+    n = len(y)
+    if n <= max_points:
+        return x, y
+    block = -(-2 * n // max_points)
+    nblocks = n // block
+    # Drop the oldest points that do not fill a block.
+    x = x[n - nblocks * block:].reshape(nblocks, block)
+    y = y[n - nblocks * block:].reshape(nblocks, block)
+    xs = np.repeat(x[:, 0], 2)
+    ys = np.empty(2 * nblocks)
+    ys[0::2] = y.min(axis=1)
+    ys[1::2] = y.max(axis=1)
+    return xs, ys
+
+
+class Reader(threading.Thread):
+    """
+    Read and parse lines into a ring buffer in the background.
+    """
+
+    def __init__(self, stream, history: int):
+        super().__init__(daemon=True)
+        self.stream = stream
+        self.history = history
+        self.parser = LineParser()
+        self.ring: Optional[RingBuffer] = None
+        self.lock = threading.Lock()
+        self.done = False
+        self.rate = 0.
+        self._rate_start = time.monotonic()
+        self._rate_lines = 0
+
+    def add(self, rows: np.ndarray) -> None:
+        if len(rows):
+            if self.ring is None:
+                self.ring = RingBuffer(self.history, self.parser.ncols)
+            self.ring.extend(rows)
+
+    def run(self) -> None:
+        while True:
+            try:
+                data = read_telemetry.read_chunk(self.stream)
+            except OSError:
+                break
+            if not data and not (read_telemetry.serial is not None and
+                                 isinstance(self.stream, read_telemetry.serial.Serial)):
+                # End of file
+                break
+            with self.lock:
+                self.add(self.parser.feed(data))
+                now = time.monotonic()
+                if now - self._rate_start >= RATE_INTERVAL:
+                    self.rate = (self.parser.nlines - self._rate_lines) / (now - self._rate_start)
+                    self._rate_start = now
+                    self._rate_lines = self.parser.nlines
+        with self.lock:
+            self.add(self.parser.flush())
+        self.done = True
+
+    def snapshot(self):
+        """
+        Return (x, y) with the line number and values of the rows in the ring buffer.
+        """
+        with self.lock:
+            if self.ring is None:
+                return None, None
+            y = self.ring.latest()
+            total = self.ring.total
+        return np.arange(total - len(y), total), y
+
+    def status(self) -> str:
+        parser = self.parser
+        return (f"{self.rate:.0f} lines/s, {parser.nlines} lines, {parser.ndropped} dropped, "
+                f"{parser.nother} other")
+
+
+def plot(reader: Reader, fps: float, max_points: int) -> None:
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    fig, ax = plt.subplots(figsize=(10, 5))
+    # The x axis is fixed, with the latest line at 0, so that blitting can scroll the lines.
+    ax.set_xlim(-reader.history, 0)
+    ax.set_xlabel("lines before the latest")
+    lines = []
+    text = ax.text(0.01, 0.99, "", transform=ax.transAxes, va="top")
+    ylim = [np.inf, -np.inf]
+
+    def update(frame):
+        x, y = reader.snapshot()
+        text.set_text(reader.status())
+        if x is None or len(x) == 0:
+            return [text]
+        x = x - x[-1]
+        redraw = False
+        while len(lines) < y.shape[1]:
+            (line,) = ax.plot([], [], lw=1, label=f"column {len(lines)}")
+            lines.append(line)
+            redraw = True
+        for j, line in enumerate(lines):
+            line.set_data(*decimate(x, y[:, j], max_points))
+        # Blitting only redraws the lines, so a full redraw is needed when the y axis changes.
+        ylo, yhi = y.min(), y.max()
+        if ylo < ylim[0] or yhi > ylim[1]:
+            pad = 0.1 * (yhi - ylo) or 1.
+            ylim[:] = ylo - pad, yhi + pad
+            ax.set_ylim(*ylim)
+            redraw = True
+        if redraw:
+            if len(lines) > 1:
+                ax.legend(loc="upper right")
+            fig.canvas.draw_idle()
+        return lines + [text]
+
+    # Keep a reference to the animation until the window is closed.
+    animation = FuncAnimation(fig, update, interval=1000 / fps, blit=True, cache_frame_data=False)
+    plt.show()
+    del animation
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Plot tuples printed by a board over a serial port.")
+    parser.add_argument("port", help="serial port, file or '-' for stdin")
+    parser.add_argument("--baudrate", type=int, default=115200, help="ignored by USB serial ports")
+    parser.add_argument("--history", type=int, default=10000, help="number of points kept and plotted")
+    parser.add_argument("--max-points", type=int, default=2000, help="points drawn per line after decimation")
+    parser.add_argument("--fps", type=float, default=20, help="plot updates per second")
+    parser.add_argument("--no-plot", action="store_true", help="only print the line rate every second")
+    args = parser.parse_args()
+
+    try:
+        stream = read_telemetry.open_port(args.port, args.baudrate)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    reader = Reader(stream, args.history)
+    start = time.monotonic()
+    reader.start()
+    try:
+        if args.no_plot:
+            while not reader.done:
+                reader.join(RATE_INTERVAL)
+                print(reader.status(), flush=True)
+        else:
+            plot(reader, args.fps, args.max_points)
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.monotonic() - start
+    print(f"Read {reader.parser.nlines} lines in {elapsed:.1f}s ({reader.parser.nlines / elapsed:.0f} lines/s), "
+          f"{reader.parser.ndropped} dropped, {reader.parser.nother} other")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+'''
+Run this script to provision many mounted CIRCUITPY drives at once, e.g. for a whole class:
+
+    cd bin
+    python provision.py <libs.zip> <code.py> <CIRCUITPY> [<CIRCUITPY> ...]
+
+where <libs.zip> is an E4S-libraries-<version>.zip file generated by update-libs.py (or a minimal
+<script>-lib.zip from minimal-libs.py), <code.py> is the program to run on each board and each
+<CIRCUITPY> is the mount point of a board's drive. Mount points can also be listed, one per line,
+in a file passed with --targets-file.
+
+The library files are decompressed once into memory, then all drives are updated in parallel
+using a pool of --jobs threads (since each drive is limited by its own USB link and flash, not
+the CPU). Each drive's lib/ folder is synchronized the same way as sync-libs.py, writing only new
+or changed files and only deleting library files recorded by a previous sync (so helper modules
+copied by hand are kept), then <code.py> is written as code.py last, so that CircuitPython only
+reloads once the libraries are in place. A drive that fails with an I/O error is retried up to
+--retries times. Finally, every drive is read back and verified against the zip and <code.py>.
+'''
+import argparse
+import importlib.util
+import os
+import sys
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# sync-libs.py cannot be imported by name because of the hyphen
+_spec = importlib.util.spec_from_file_location("sync_libs", Path(__file__).with_name("sync-libs.py"))
+sync_libs = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(sync_libs)
+
+CODE_NAME = "code.py"
+RETRY_DELAY = 1.0  # seconds
+
+_print_lock = threading.Lock()
+
+
+def progress(target: Path, message: str) -> None:
+    with _print_lock:
+        print(f"{target}: {message}", flush=True)
+
+
+def write_buffer(data: bytes, path: Path) -> None:
+    # Opening an existing file for writing truncates it in place, keeping its directory entry
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def needs_write(data: bytes, path: Path) -> bool:
+    try:
+        if path.stat().st_size != len(data):
+            return True
+    except FileNotFoundError:
+        return True
+    return sync_libs.update_libs.file_crc32(path) != zlib.crc32(data)
+
+
+def provision(members: Dict[str, zipfile.ZipInfo], buffers: Dict[str, bytes], code: bytes, target: Path,
+              delete: bool = True) -> str:
+    """
+    Synchronize target/lib/ with the decompressed buffers, then write code.py. Returns a summary.
+    """
+    plan = sync_libs.plan_sync(members, target, sync_libs.read_manifest(target))
+    if delete:
+        sync_libs.delete_stale(plan, target)
+
+    writes = sync_libs.ordered_writes(plan)
+    step = max(1, len(writes) // 4)
+    for i, rel_posix in enumerate(writes, 1):
+        path = target / rel_posix
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_buffer(buffers[rel_posix], path)
+        if i % step == 0 or i == len(writes):
+            progress(target, f"{i}/{len(writes)} library files written")
+    sync_libs.write_manifest(target, set(members) | (set() if delete else set(plan.stale)))
+
+    wrote_code = needs_write(code, target / CODE_NAME)
+    if wrote_code:
+        write_buffer(code, target / CODE_NAME)
+
+    return (f"{len(plan.new)} new, {len(plan.changed)} changed, {len(plan.stale) if delete else 0} deleted, "
+            f"{CODE_NAME} {'written' if wrote_code else 'unchanged'}")
+
+
+def provision_with_retry(members: Dict[str, zipfile.ZipInfo], buffers: Dict[str, bytes], code: bytes,
+                         target: Path, retries: int, delete: bool = True) -> Optional[str]:
+    """
+    Run provision() on target, retrying on I/O errors. Returns None after the last failure.
+    """
+    for attempt in range(retries + 1):
+        try:
+            summary = provision(members, buffers, code, target, delete)
+            progress(target, summary)
+            return summary
+        except OSError as e:
+            progress(target, f"attempt {attempt + 1} failed: {e}")
+            if attempt < retries:
+                time.sleep(RETRY_DELAY)
+    return None
+
+
+def verify(members: Dict[str, zipfile.ZipInfo], code: bytes, target: Path, delete: bool = True) -> List[str]:
+    """
+    Return a list of problems found by reading target back, which is empty if it matches.
+    """
+    try:
+        plan = sync_libs.plan_sync(members, target, sync_libs.read_manifest(target))
+        problems = [f"missing {p}" for p in plan.new] + [f"differs {p}" for p in plan.changed]
+        if delete:
+            problems += [f"stale {p}" for p in plan.stale]
+        if needs_write(code, target / CODE_NAME):
+            problems.append(f"differs {CODE_NAME}")
+    except OSError as e:
+        problems = [str(e)]
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Copy a library zip and a code.py onto many mounted CIRCUITPY drives in parallel.")
+    parser.add_argument("libs_zip", help="zip file with library files under lib/")
+    parser.add_argument("code", help="program to install as code.py")
+    parser.add_argument("targets", nargs="*", help="mount points of the CIRCUITPY drives")
+    parser.add_argument("--targets-file", help="file listing one mount point per line")
+    parser.add_argument("--jobs", type=int, default=8, help="number of drives written at the same time")
+    parser.add_argument("--retries", type=int, default=2, help="retries of a drive after an I/O error")
+    parser.add_argument(
+        "--keep", action="store_true", help="do not delete library files from a previous sync that are missing in the zip")
+    args = parser.parse_args()
+
+    targets = [Path(t) for t in args.targets]
+    try:
+        if args.targets_file:
+            with open(args.targets_file) as f:
+                targets += [Path(line.strip()) for line in f if line.strip()]
+        with open(args.code, "rb") as f:
+            code = f.read()
+        # Decompress each library file once, to share between all drives
+        with zipfile.ZipFile(args.libs_zip, "r") as zlib_file:
+            members = sync_libs.lib_members(zlib_file)
+            buffers = {rel_posix: zlib_file.read(info) for rel_posix, info in members.items()}
+    except FileNotFoundError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except zipfile.BadZipFile as e:
+        print(f"Error: bad zip file: {e}", file=sys.stderr)
+        sys.exit(1)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if not targets:
+        print("Error: no CIRCUITPY mount points given", file=sys.stderr)
+        sys.exit(1)
+    for target in targets:
+        if not target.is_dir():
+            print(f"Error: not a directory: {target}", file=sys.stderr)
+            sys.exit(1)
+
+    delete = not args.keep
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        results = list(pool.map(
+            lambda target: provision_with_retry(members, buffers, code, target, args.retries, delete), targets))
+    failed = [target for target, result in zip(targets, results) if result is None]
+
+    # Read every drive back, including any that failed, for a complete report
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        problems = list(pool.map(lambda target: verify(members, code, target, delete), targets))
+    for target, target_problems in zip(targets, problems):
+        for problem in target_problems:
+            print(f"Error: {target}: {problem}", file=sys.stderr)
+    bad = [target for target, target_problems in zip(targets, problems) if target_problems]
+
+    print(f"Provisioned {len(targets) - len(bad)}/{len(targets)} drives "
+          f"({len(failed)} failed after {args.retries} retries)")
+    if bad:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
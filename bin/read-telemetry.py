@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+'''
+Run this script to read the binary frames sent by lib/e4s_telemetry.py from a board:
+
+    cd bin
+    python read-telemetry.py <port> [--output data.npz]
+
+where <port> is the second USB serial port of the board, i.e. its usb_cdc.data port, which is
+usually the last of the two ports that appear when it is plugged in (e.g. /dev/ttyACM1 on linux,
+/dev/cu.usbmodem...3 on macOS or COM4 on Windows). Any file or pipe with recorded frames can also
+be read, e.g. '-' for stdin.
+
+Each frame is decoded directly into a numpy array with np.frombuffer, using the typecode and item
+size in its header (so that e.g. 'l' arrays are decoded correctly whether they were sent by the
+board, with 4 bytes per value, or by a 64-bit computer, with 8), after checking its CRC32. Frames
+with a bad checksum are dropped, and the decoder scans forward to the next b'E4' magic to
+resynchronize, so a board that is reset or plugged in while streaming does not confuse it. Missing frames are counted from gaps in the frame counters.
+
+The number of frames, bytes, bad and missing frames and the data rate are printed every second.
+Stop with ctrl-C or --count. With --output, the arrays of each channel are concatenated and saved
+to a .npz file with one array per channel, named channel0, channel1, ...
+
+The serial port is read with pyserial when it is installed (pip install pyserial), otherwise it
+is opened as a plain file, which works for a pty or a port already configured by the OS.
+
+Run check-telemetry.py to check that frames written by e4s_telemetry.py are decoded correctly.
+'''
+import argparse
+import struct
+import sys
+import time
+import zlib
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+MAGIC = b'E4'
+HEADER = struct.Struct('<2sBBBHH')
+TRAILER = struct.Struct('<L')
+CHUNK_SIZE = 64 * 1024
+
+# Numpy kind of each typecode, whose size is given by the frame header.
+KINDS = {'b': 'i', 'h': 'i', 'i': 'i', 'l': 'i', 'q': 'i',
+         'B': 'u', 'H': 'u', 'I': 'u', 'L': 'u', 'Q': 'u', 'f': 'f', 'd': 'f'}
+
+
+def frame_dtype(code: int, itemsize: int) -> Optional[np.dtype]:
+    """
+    Return the little-endian dtype of a typecode and item size, or None if they are not valid.
+    """
+    kind = KINDS.get(chr(code))
+    if kind is None or itemsize not in ((4, 8) if kind == 'f' else (1, 2, 4, 8)):
+        return None
+    return np.dtype(f'<{kind}{itemsize}')
+
+
+class FrameDecoder:
+    """
+    Decode frames from a stream of bytes passed to feed() in chunks of any size.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.nframes = 0
+        self.nbytes = 0
+        self.nbad = 0  # frames with a bad checksum, typecode or item size
+        self.nlost = 0  # frames missing from the sequence
+        self.nskipped = 0  # bytes skipped while searching for a frame
+        self.last_seq = None
+
+    def feed(self, data: bytes) -> List[Tuple[int, np.ndarray]]:
+        """
+        Add data and return a list of (channel, array) for each complete frame.
+        """
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        pos = 0
+        while True:
+            start = buffer.find(MAGIC, pos)
+            if start < 0:
+                # Keep a possible first byte of the magic.
+                keep = len(buffer) - 1 if buffer.endswith(MAGIC[:1]) else len(buffer)
+                self.nskipped += keep - pos
+                pos = keep
+                break
+            self.nskipped += start - pos
+            pos = start
+            if len(buffer) - pos < HEADER.size:
+                break
+            _, channel, code, itemsize, seq, nbytes = HEADER.unpack_from(buffer, pos)
+            end = pos + HEADER.size + nbytes + TRAILER.size
+            if len(buffer) < end:
+                break
+            (crc,) = TRAILER.unpack_from(buffer, end - TRAILER.size)
+            body = memoryview(buffer)[pos:end - TRAILER.size]
+            dtype = frame_dtype(code, itemsize)
+            valid = zlib.crc32(body) == crc and dtype is not None and nbytes % dtype.itemsize == 0
+            if not valid:
+                # Resynchronize on the next magic after this one.
+                body.release()
+                self.nbad += 1
+                self.nskipped += 1
+                pos += 1
+                continue
+            # Copy the data out of the buffer, which is reused.
+            frames.append((channel, np.frombuffer(body[HEADER.size:], dtype=dtype).copy()))
+            body.release()
+            if self.last_seq is not None:
+                self.nlost += (seq - self.last_seq - 1) & 0xffff
+            self.last_seq = seq
+            self.nframes += 1
+            self.nbytes += end - pos
+            pos = end
+        del buffer[:pos]
+        return frames
+
+
+def open_port(port: str, baudrate: int) -> BinaryIO:
+    if port == '-':
+        return sys.stdin.buffer
+    if serial is not None:
+        try:
+            return serial.Serial(port, baudrate, timeout=0.1)
+        except (serial.SerialException, ValueError):
+            # Not a serial port, e.g. a regular file.
+            pass
+    return open(port, 'rb', buffering=0)
+
+
+def read_chunk(stream: BinaryIO) -> bytes:
+    if serial is not None and isinstance(stream, serial.Serial):
+        return stream.read(max(1, min(CHUNK_SIZE, stream.in_waiting)))
+    return stream.read(CHUNK_SIZE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Decode binary telemetry frames sent by e4s_telemetry.py.")
+    parser.add_argument("port", help="serial port, file or '-' for stdin")
+    parser.add_argument("--baudrate", type=int, default=115200, help="ignored by USB serial ports")
+    parser.add_argument("--count", type=int, default=0, help="stop after this many frames")
+    parser.add_argument("--output", help="save the arrays of each channel to this .npz file")
+    args = parser.parse_args()
+
+    try:
+        stream = open_port(args.port, args.baudrate)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    decoder = FrameDecoder()
+    channels: Dict[int, List[np.ndarray]] = {}
+    start = last_report = time.monotonic()
+    try:
+        while not args.count or decoder.nframes < args.count:
+            data = read_chunk(stream)
+            if not data and not (serial is not None and isinstance(stream, serial.Serial)):
+                # End of file
+                break
+            for channel, values in decoder.feed(data):
+                if args.output:
+                    channels.setdefault(channel, []).append(values)
+            now = time.monotonic()
+            if now - last_report >= 1:
+                last_report = now
+                rate = decoder.nbytes / (now - start) / 1e3
+                print(f"{decoder.nframes} frames, {decoder.nbytes} bytes ({rate:.1f} kB/s), "
+                      f"{decoder.nbad} bad, {decoder.nlost} lost", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stream.close()
+
+    elapsed = time.monotonic() - start
+    print(f"Read {decoder.nframes} frames, {decoder.nbytes} bytes in {elapsed:.1f}s: "
+          f"{decoder.nbad} bad, {decoder.nlost} lost, {decoder.nskipped} bytes skipped")
+    if args.output:
+        np.savez(args.output, **{f"channel{channel}": np.concatenate(arrays)
+                                 for channel, arrays in sorted(channels.items())})
+        print(f"Saved {len(channels)} channels to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+
+'''
+Run this script to record everything a board sends over a serial port for hours:
+
+    cd bin
+    python record-serial.py <directory> <port>
+
+where <port> is read the same way as plot-serial.py (printed tuples, the default) or, with
+--binary, read-telemetry.py (frames from e4s_telemetry.py, where the arrays sent together with
+telemetry.send(x, y, ...) become the columns). Each row of values is stored with a time in seconds
+since 1970, spread evenly between the times that consecutive batches were received. At end of
+file or ctrl-C, the last line is recorded even without a newline and, with --binary, so are the
+frames of the last send(), with NaN for the columns that were not received.
+
+The rows are appended to a series of .npy files in <directory>, each holding a 2D float64 array
+with the time in column 0. Each file is preallocated with room for --chunk-mb of rows and written
+through a memory map, so appending is a plain copy into memory that the OS writes back to disk in
+the background. A new file is started when the current one is full, or after --chunk-seconds.
+The file index.json lists the files in order with the number of valid rows and the time range of
+each. It is rewritten (atomically, by renaming a temporary file) every --index-interval seconds
+while recording, after the rows it counts have been written. Rows past the count of a file are
+unused and zero.
+
+A recording can be read while it continues, without copying any data:
+
+    recording = Recording('<directory>')
+    for chunk in recording.slice(t0, t1):
+        times, values = chunk[:, 0], chunk[:, 1:]
+
+where each chunk is a view into a memory-mapped file. Call recording.refresh() to see new rows.
+
+Run with --benchmark (and no <port>) to measure the sustained write rate of synthetic rows into
+<directory> for 2 seconds, as fast as possible, and the latency of a reader slicing the latest
+second of data at the same time. This writes about 1 GB on a fast disk, so use a temporary directory.
+'''
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# plot-serial.py and read-telemetry.py cannot be imported by name because of the hyphen
+_spec = importlib.util.spec_from_file_location("plot_serial", Path(__file__).with_name("plot-serial.py"))
+plot_serial = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(plot_serial)
+read_telemetry = plot_serial.read_telemetry
+
+INDEX_NAME = "index.json"
+INDEX_FORMAT = 1
+DTYPE = np.dtype('<f8')
+
+
+def chunk_name(number: int) -> str:
+    return f"chunk-{number:06d}.npy"
+
+
+class ChunkWriter:
+    """
+    Append rows of (time, values) to a series of preallocated memory-mapped .npy files.
+    """
+
+    def __init__(self, directory: Path, ncols: int, chunk_bytes: int, chunk_seconds: float,
+                 index_interval: float):
+        self.directory = directory
+        self.ncols = ncols
+        self.capacity = max(1, chunk_bytes // (DTYPE.itemsize * (1 + ncols)))
+        self.chunk_seconds = chunk_seconds
+        self.index_interval = index_interval
+        directory.mkdir(parents=True, exist_ok=True)
+        index_path = directory / INDEX_NAME
+        if index_path.exists():
+            raise FileExistsError(f"{index_path} already exists")
+        self.chunks: List[Dict] = []
+        self.array: Optional[np.memmap] = None
+        self.opened = 0.  # monotonic time when the current chunk was opened
+        self.last_index = 0.
+        self.nrows = 0
+
+    def _open_chunk(self) -> None:
+        info = {"file": chunk_name(len(self.chunks)), "nrows": 0, "start": None, "stop": None}
+        self.array = np.lib.format.open_memmap(
+            self.directory / info["file"], mode="w+", dtype=DTYPE, shape=(self.capacity, 1 + self.ncols))
+        self.chunks.append(info)
+        self.opened = time.monotonic()
+
+    def _close_chunk(self) -> None:
+        if self.array is not None:
+            self.array.flush()
+            self.array = None
+
+    def append(self, times: np.ndarray, values: np.ndarray) -> None:
+        n = len(times)
+        done = 0
+        while done < n:
+            if self.array is None or self.chunks[-1]["nrows"] == self.capacity or (
+                    time.monotonic() - self.opened >= self.chunk_seconds):
+                self._close_chunk()
+                self._open_chunk()
+            info = self.chunks[-1]
+            start = info["nrows"]
+            take = min(n - done, self.capacity - start)
+            self.array[start:start + take, 0] = times[done:done + take]
+            self.array[start:start + take, 1:] = values[done:done + take]
+            if info["start"] is None:
+                info["start"] = float(times[done])
+            info["stop"] = float(times[done + take - 1])
+            info["nrows"] = start + take
+            done += take
+        self.nrows += n
+        if time.monotonic() - self.last_index >= self.index_interval:
+            self.write_index()
+
+    def write_index(self, recording: bool = True) -> None:
+        self.last_index = time.monotonic()
+        index = {"format": INDEX_FORMAT, "ncols": self.ncols, "recording": recording, "chunks": self.chunks}
+        tmp = self.directory / (INDEX_NAME + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp, self.directory / INDEX_NAME)
+
+    def close(self) -> None:
+        self._close_chunk()
+        self.write_index(recording=False)
+
+
+class Recording:
+    """
+    Read a recording, possibly while it continues.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.maps: Dict[str, np.ndarray] = {}
+        self.refresh()
+
+    def refresh(self) -> None:
+        """
+        Reload the index to see the rows written since the last refresh.
+        """
+        with open(self.directory / INDEX_NAME) as f:
+            index = json.load(f)
+        if index["format"] != INDEX_FORMAT:
+            raise ValueError(f"unsupported index format {index['format']}")
+        self.ncols = index["ncols"]
+        self.recording = index["recording"]
+        self.chunks = [info for info in index["chunks"] if info["nrows"] > 0]
+
+    @property
+    def nrows(self) -> int:
+        return sum(info["nrows"] for info in self.chunks)
+
+    def chunk(self, info: Dict) -> np.ndarray:
+        """
+        Return the valid rows of one chunk as a view of its memory map.
+        """
+        name = info["file"]
+        if name not in self.maps:
+            self.maps[name] = np.load(self.directory / name, mmap_mode="r")
+        return self.maps[name][:info["nrows"]]
+
+    def slice(self, t0: float = -np.inf, t1: float = np.inf) -> List[np.ndarray]:
+        """
+        Return views of the rows with t0 <= time < t1, one per chunk, oldest first.
+        """
+        out = []
+        for info in self.chunks:
+            if info["stop"] < t0 or info["start"] >= t1:
+                continue
+            rows = self.chunk(info)
+            times = rows[:, 0]
+            lo, hi = np.searchsorted(times, [t0, t1])
+            if hi > lo:
+                out.append(rows[lo:hi])
+        return out
+
+
+class FrameGrouper:
+    """
+    Combine the frames of each telemetry.send(x, y, ...) into rows with one column per array.
+    """
+
+    def __init__(self):
+        self.group: List[np.ndarray] = []
+        self.ncols = 0  # set by the first complete group
+        self.ndropped = 0  # frames in incomplete groups
+
+    def feed(self, frames) -> np.ndarray:
+        rows = []
+        for channel, values in frames:
+            if channel == 0 and self.group:
+                self._finish(rows)
+            if channel != len(self.group):
+                # A frame of this group was lost.
+                self.ndropped += len(self.group) + 1
+                self.group = []
+                continue
+            self.group.append(values)
+            if self.ncols and len(self.group) == self.ncols:
+                self._finish(rows)
+        return np.concatenate(rows) if rows else np.empty((0, self.ncols))
+
+    def flush(self) -> np.ndarray:
+        """
+        Return the rows of the group still being accumulated, at the end of the stream. Its
+        missing columns, whose frames were never sent, are filled with NaN.
+        """
+        rows: List[np.ndarray] = []
+        if self.group:
+            self._finish(rows, pad=True)
+        return np.concatenate(rows) if rows else np.empty((0, self.ncols))
+
+    def _finish(self, rows: List[np.ndarray], pad: bool = False) -> None:
+        group, self.group = self.group, []
+        if not self.ncols:
+            self.ncols = len(group)
+        if len({len(values) for values in group}) != 1 or len(group) > self.ncols or (
+                len(group) < self.ncols and not pad):
+            self.ndropped += len(group)
+            return
+        group += [np.full(len(group[0]), np.nan)] * (self.ncols - len(group))
+        rows.append(np.stack(group, axis=1).astype(DTYPE))
+
+
+def record(stream, directory: Path, binary: bool, chunk_bytes: int, chunk_seconds: float,
+           index_interval: float) -> None:
+    parser = FrameGrouper() if binary else plot_serial.LineParser()
+    decoder = read_telemetry.FrameDecoder() if binary else None
+    is_serial = read_telemetry.serial is not None and isinstance(stream, read_telemetry.serial.Serial)
+    writer = None
+    last_time = time.time()
+    last_report = time.monotonic()
+
+    def write(rows: np.ndarray) -> None:
+        nonlocal writer, last_time
+        now = time.time()
+        if len(rows):
+            if writer is None:
+                writer = ChunkWriter(directory, rows.shape[1], chunk_bytes, chunk_seconds, index_interval)
+            # Spread the rows evenly since the previous batch.
+            times = last_time + (now - last_time) * np.arange(1, len(rows) + 1) / len(rows)
+            writer.append(times, rows)
+        last_time = now
+
+    try:
+        while True:
+            data = read_telemetry.read_chunk(stream)
+            if not data and not is_serial:
+                # End of file
+                break
+            write(parser.feed(decoder.feed(data) if binary else data))
+            if time.monotonic() - last_report >= 1 and writer is not None:
+                last_report = time.monotonic()
+                print(f"{writer.nrows} rows in {len(writer.chunks)} files, {parser.ndropped} dropped", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            # Keep the last line, or the frames of the last telemetry.send(), received before stopping.
+            write(parser.flush())
+        finally:
+            if writer is not None:
+                writer.close()
+    nrows = writer.nrows if writer is not None else 0
+    print(f"Recorded {nrows} rows to {directory} ({parser.ndropped} dropped)")
+
+
+def benchmark(directory: Path, chunk_bytes: int, chunk_seconds: float, index_interval: float,
+              duration: float = 2., ncols: int = 4, batch: int = 1000) -> None:
+    writer = ChunkWriter(directory, ncols, chunk_bytes, chunk_seconds, index_interval)
+    values = np.random.default_rng(1).normal(size=(batch, ncols))
+    stop = threading.Event()
+    latencies: List[float] = []
+    staleness: List[float] = []
+    nread: List[int] = []
+
+    def reader():
+        while not (directory / INDEX_NAME).exists():
+            time.sleep(0.01)
+        recording = Recording(directory)
+        while not stop.is_set():
+            start = time.perf_counter()
+            recording.refresh()
+            if recording.chunks:
+                t1 = recording.chunks[-1]["stop"]
+                views = recording.slice(t1 - 1, np.inf)
+                latencies.append(time.perf_counter() - start)
+                staleness.append(time.time() - t1)
+                nread.append(sum(len(view) for view in views))
+            time.sleep(0.01)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    start = time.monotonic()
+    last_time = time.time()
+    while time.monotonic() - start < duration:
+        now = time.time()
+        writer.append(last_time + (now - last_time) * np.arange(1, batch + 1) / batch, values)
+        last_time = now
+    elapsed = time.monotonic() - start
+    writer.close()
+    stop.set()
+    thread.join()
+
+    nbytes = writer.nrows * DTYPE.itemsize * (1 + ncols)
+    print(f"Wrote {writer.nrows} rows of {ncols} values in {len(writer.chunks)} files: "
+          f"{writer.nrows / elapsed / 1e6:.2f} M rows/s, {nbytes / elapsed / 1e6:.0f} MB/s")
+    if latencies:
+        latencies_ms = 1e3 * np.array(latencies)
+        print(f"Reader: {len(latencies)} slices of the latest second ({np.median(nread):.0f} rows), "
+              f"latency median {np.median(latencies_ms):.2f} ms, max {latencies_ms.max():.2f} ms, "
+              f"data age median {1e3 * np.median(staleness):.0f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Record a serial stream to chunked memory-mapped .npy files.")
+    parser.add_argument("directory", help="directory of the recording, which must not already contain one")
+    parser.add_argument("port", nargs="?", help="serial port, file or '-' for stdin")
+    parser.add_argument("--binary", action="store_true", help="read frames from e4s_telemetry.py instead of tuples")
+    parser.add_argument("--baudrate", type=int, default=115200, help="ignored by USB serial ports")
+    parser.add_argument("--chunk-mb", type=float, default=64, help="size of each .npy file")
+    parser.add_argument("--chunk-seconds", type=float, default=3600, help="start a new file after this time")
+    parser.add_argument("--index-interval", type=float, default=0.5, help="seconds between index updates")
+    parser.add_argument("--benchmark", action="store_true", help="record synthetic rows instead of a port")
+    args = parser.parse_args()
+
+    directory = Path(args.directory)
+    chunk_bytes = int(args.chunk_mb * 1024 * 1024)
+    if (directory / INDEX_NAME).exists():
+        print(f"Error: {directory} already contains a recording", file=sys.stderr)
+        sys.exit(1)
+    if args.benchmark:
+        benchmark(directory, chunk_bytes, args.chunk_seconds, args.index_interval)
+        return
+    if args.port is None:
+        print("Error: no port given", file=sys.stderr)
+        sys.exit(1)
+    try:
+        stream = read_telemetry.open_port(args.port, args.baudrate)
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        record(stream, directory, args.binary, chunk_bytes, args.chunk_seconds, args.index_interval)
+    finally:
+        stream.close()
+
+
+if __name__ == "__main__":
+    main()
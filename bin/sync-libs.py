@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+'''
+Run this script to update the lib/ folder of a mounted CIRCUITPY drive from a library zip file:
+
+    cd bin
+    python sync-libs.py <libs.zip> <CIRCUITPY>
+
+where <libs.zip> is an E4S-libraries-<version>.zip file generated by update-libs.py (or a minimal
+<script>-lib.zip from minimal-libs.py), and <CIRCUITPY> is the mount point of the drive, e.g.
+/Volumes/CIRCUITPY on macOS, /media/$USER/CIRCUITPY on linux or D:\\ on Windows.
+
+Instead of copying the whole lib/ folder, the files under 'lib/' in the zip are compared with the
+files already on the drive, first by size and then by CRC32 (which the zip stores for each file).
+Only new or changed files are written. This is much faster than a full copy on the slow flash of
+the microcontroller, and avoids wearing it out.
+
+The paths of the synced files are recorded in CIRCUITPY/.e4s-libs.txt. Files under CIRCUITPY/lib/
+that are not in the zip are only deleted if they were recorded by a previous sync, i.e. they came
+from an older library zip (add --keep to leave them in place). Any other files, e.g. helper modules
+or libraries that you copied by hand, are never deleted.
+
+Operations are ordered to limit updates of the FAT (file allocation table) and directory entries:
+stale files are deleted first, so their clusters can be reused by the new files, then each
+directory is updated in turn, overwriting changed files in place (which keeps their directory
+entries) before creating new ones. Each written file is flushed to the drive before the next one.
+
+Add --dry-run to list the planned changes without touching the drive.
+'''
+import argparse
+import importlib.util
+import os
+import sys
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, NamedTuple, Set
+
+# update-libs.py cannot be imported by name because of the hyphen
+_spec = importlib.util.spec_from_file_location("update_libs", Path(__file__).with_name("update-libs.py"))
+update_libs = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(update_libs)
+
+# Paths of the files written by the last sync, relative to the target
+MANIFEST_NAME = ".e4s-libs.txt"
+
+
+class SyncPlan(NamedTuple):
+    new: List[str]  # zip members missing on the target
+    changed: List[str]  # zip members whose size or CRC32 differ on the target
+    stale: List[str]  # target files under lib/ from a previous sync that are not in the zip
+    unchanged: List[str]
+    unmanaged: List[str]  # other target files under lib/ that are not in the zip, never deleted
+
+
+def lib_members(zlib_file: zipfile.ZipFile) -> Dict[str, zipfile.ZipInfo]:
+    """
+    Return the files under 'lib/' in the zip, keyed by their safe posix path.
+    """
+    out = {}
+    for info in zlib_file.infolist():
+        if info.is_dir():
+            continue
+        try:
+            rel_posix = update_libs.safe_posix_path(info.filename).as_posix()
+        except ValueError as e:
+            print(f"Warning: {e}; skipping", file=sys.stderr)
+            continue
+        if rel_posix.startswith("lib/") and not update_libs.is_macos_junk(rel_posix):
+            out[rel_posix] = info
+    return out
+
+
+def target_files(target: Path) -> List[str]:
+    """
+    Return the posix paths, relative to target, of all files under target/lib/.
+    macOS special files are ignored since the OS manages them.
+    """
+    out = []
+    for root, dirnames, filenames in os.walk(target / "lib"):
+        dirnames[:] = [d for d in dirnames if d not in update_libs.SKIP_DIRS]
+        for fn in filenames:
+            rel_posix = PurePosixPath(*(Path(root) / fn).relative_to(target).parts).as_posix()
+            if not update_libs.is_macos_junk(rel_posix):
+                out.append(rel_posix)
+    return out
+
+
+def read_manifest(target: Path) -> Set[str]:
+    """
+    Return the paths recorded by the previous sync to target, if any.
+    """
+    try:
+        with open(target / MANIFEST_NAME) as f:
+            return {line.strip() for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def write_manifest(target: Path, paths: Set[str]) -> None:
+    # Write then rename, so that an interrupted sync leaves the previous manifest in place
+    path = target / MANIFEST_NAME
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write("".join(f"{p}\n" for p in sorted(paths)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def plan_sync(members: Dict[str, zipfile.ZipInfo], target: Path, previous: Set[str] = frozenset()) -> SyncPlan:
+    """
+    Compare the zip members with the files on target. Files missing in the zip are stale
+    if they are listed in previous (see read_manifest), otherwise they are unmanaged.
+    """
+    plan = SyncPlan([], [], [], [], [])
+    for rel_posix, info in sorted(members.items()):
+        path = target / rel_posix
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            plan.new.append(rel_posix)
+            continue
+        # Only read files back from the drive when the size cannot tell them apart
+        if size == info.file_size and update_libs.file_crc32(path) == info.CRC:
+            plan.unchanged.append(rel_posix)
+        else:
+            plan.changed.append(rel_posix)
+    extra = set(target_files(target)) - set(members)
+    plan.stale.extend(sorted(extra & previous))
+    plan.unmanaged.extend(sorted(extra - previous))
+    return plan
+
+
+def write_member(zlib_file: zipfile.ZipFile, info: zipfile.ZipInfo, path: Path,
+                 chunk_size: int = update_libs.CHUNK_SIZE) -> None:
+    # Opening an existing file for writing truncates it in place, keeping its directory entry
+    with zlib_file.open(info, "r") as src, open(path, "wb") as dst:
+        for chunk in iter(lambda: src.read(chunk_size), b""):
+            dst.write(chunk)
+        dst.flush()
+        os.fsync(dst.fileno())
+
+
+def delete_stale(plan: SyncPlan, target: Path) -> None:
+    for rel_posix in plan.stale:
+        (target / rel_posix).unlink()
+    # Remove directories left empty, deepest first
+    for rel_dir in sorted({str(PurePosixPath(p).parent) for p in plan.stale}, key=len, reverse=True):
+        path = target / rel_dir
+        while path != target / "lib" and path.is_dir() and not any(path.iterdir()):
+            path.rmdir()
+            path = path.parent
+
+
+def ordered_writes(plan: SyncPlan) -> List[str]:
+    """
+    Return the files to write, grouped by directory, with changed files before new ones in each directory.
+    """
+    writes = [(str(PurePosixPath(p).parent), 0, p) for p in plan.changed]
+    writes += [(str(PurePosixPath(p).parent), 1, p) for p in plan.new]
+    return [rel_posix for _, _, rel_posix in sorted(writes)]
+
+
+def apply_sync(zlib_file: zipfile.ZipFile, members: Dict[str, zipfile.ZipInfo], plan: SyncPlan,
+               target: Path, delete: bool = True) -> None:
+    if delete:
+        delete_stale(plan, target)
+    for rel_posix in ordered_writes(plan):
+        path = target / rel_posix
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_member(zlib_file, members[rel_posix], path)
+    # Stale files that were kept are still from a library zip, so can be deleted by a later sync
+    write_manifest(target, set(members) | (set() if delete else set(plan.stale)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Update the lib/ folder of a mounted CIRCUITPY drive, writing only new or changed files.")
+    parser.add_argument("libs_zip", help="zip file with library files under lib/")
+    parser.add_argument("target", help="mount point of the CIRCUITPY drive")
+    parser.add_argument(
+        "--keep", action="store_true", help="do not delete files from a previous sync that are missing in the zip")
+    parser.add_argument("--dry-run", action="store_true", help="only list the planned changes")
+    args = parser.parse_args()
+
+    target = Path(args.target)
+    if not target.is_dir():
+        print(f"Error: not a directory: {target}", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        with zipfile.ZipFile(args.libs_zip, "r") as zlib_file:
+            members = lib_members(zlib_file)
+            plan = plan_sync(members, target, read_manifest(target))
+            if args.dry_run:
+                for label, names in (("new", plan.new), ("changed", plan.changed), ("stale", plan.stale),
+                                     ("kept", plan.unmanaged)):
+                    for name in names:
+                        print(f"{label:>8} {name}")
+            else:
+                apply_sync(zlib_file, members, plan, target, delete=not args.keep)
+    except FileNotFoundError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except zipfile.BadZipFile as e:
+        print(f"Error: bad zip file: {e}", file=sys.stderr)
+        sys.exit(1)
+    except OSError as e:
+        print(f"Error: failed updating '{target}': {e}", file=sys.stderr)
+        sys.exit(1)
+
+    deleted = 0 if args.keep else len(plan.stale)
+    print(f"{'Would update' if args.dry_run else 'Updated'} {target / 'lib'}: {len(plan.new)} new, "
+          f"{len(plan.changed)} changed, {len(plan.unchanged)} unchanged, {deleted} deleted, "
+          f"{len(plan.unmanaged)} kept")
+
+
+if __name__ == "__main__":
+    main()
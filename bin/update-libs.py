@@ -25,24 +25,79 @@ Sample command used to update from 9.x to 10.x for 2026:
 
 This generates E4S-libraries-10.x.zip in the current directory, ready to commit to the github repo.
 
+Add --stream to copy the library files straight from the bundle zip into the output zip,
+in fixed-size chunks, without the temporary directory:
+
+    python update-libs.py --stream E4S-libraries-9.x.zip ~/Downloads/adafruit-circuitpython-bundle-10.x-mpy-20251231.zip
+
+Add --incremental instead to also compare the CRC32 and size of each library file in the bundle
+against the previous output zip (if E4S-libraries-<version>.zip already exists in the current
+directory) and the input zip. Unchanged files have their compressed data copied as-is and only
+changed files are recompressed. A summary of changed, unchanged and missing files is printed.
+
+Several input zips (profiles) can be updated in a single pass, indexing the bundle only once.
+Each output is named after its input with the version tag replaced, e.g. E4S-libraries-8.x-2024.zip
+becomes E4S-libraries-10.x-2024.zip. Profiles can also be listed in a JSON manifest (see
+load_manifest), and --jobs N writes the outputs using N worker processes:
+
+    python update-libs.py --jobs 2 E4S-libraries-8.x-2023.zip E4S-libraries-8.x-2024.zip ~/Downloads/adafruit-circuitpython-bundle-10.x-mpy-20251231.zip
+    python update-libs.py --manifest profiles.json ~/Downloads/adafruit-circuitpython-bundle-10.x-mpy-20251231.zip
+
+The output zips are reproducible: entries are sorted and written with a fixed timestamp, file mode
+and compression level, so the same inputs always give the same output zip. With --cache-dir DIR,
+each output is also saved in DIR under a name derived from the SHA-256 of the input and bundle
+zips and of the build options (--stream or --incremental, with the previous output, and the zip
+settings), and later runs with the same inputs and options copy it from there instead of reading
+the bundle. Multiple inputs, --manifest and --cache-dir all write the outputs as with --stream.
+
 To check the contents of the created zip file, you can use:
 
     unzip -l E4S-libraries-10.x.zip
 '''
+import argparse
+import bisect
+import hashlib
+import json
 import os
 import re
+import shutil
+import struct
 import sys
 import tempfile
 import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import PurePosixPath, Path
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
 
 VERSION_RE = re.compile(r"-([0-9]+\.x)-")
+# Version tag in the name of an input zip, e.g. E4S-libraries-9.x.zip or E4S-libraries-8.x-2024.zip
+PROFILE_VERSION_RE = re.compile(r"-[0-9]+\.x(?=[-.])")
 
 # Common macOS junk we don't want in the output zip
 SKIP_DIRS = {"__MACOSX", ".Spotlight-V100", ".Trashes", ".fseventsd"}
 SKIP_FILES = {".DS_Store", "Icon\r"}  # "Icon\r" shows up sometimes on mac volumes
 
+# Buffer size used when streaming members between zip files
+CHUNK_SIZE = 64 * 1024
+
+# Fixed metadata of output zip members, so that identical inputs produce byte-identical zips
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+ZIP_FILE_MODE = 0o100644  # regular file, rw-r--r--
+ZIP_CREATE_SYSTEM = 3  # Unix, whatever platform the zip is created on
+ZIP_COMPRESSLEVEL = 9
+
+# Bump whenever a change to this script changes the output zips, to invalidate cached outputs
+CACHE_FORMAT = 3
+
+# Local file header layout (see APPNOTE.TXT section 4.3.7), used to locate raw member data
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+LOCAL_HEADER_SIGNATURE = b"PK\003\004"
+
+# General purpose flag bits
+FLAG_ENCRYPTED = 0x01
+FLAG_DATA_DESCRIPTOR = 0x08
+
 
 def extract_version(bundle_zip_name: str) -> str:
     m = VERSION_RE.search(os.path.basename(bundle_zip_name))
@@ -72,13 +127,46 @@ def apply_mode_if_present(info: zipfile.ZipInfo, out_path: Path) -> None:
             pass
 
 
-def build_bundle_index(zbundle: zipfile.ZipFile) -> Dict[str, zipfile.ZipInfo]:
+def normalize_stem(name: str) -> str:
+    """
+    Reduce a file name to a lowercase stem without separators, e.g. 'LSM6DS3_trc.mpy' -> 'lsm6ds3trc'.
+    """
+    stem = name.rsplit("/", 1)[-1].split(".", 1)[0]
+    return stem.lower().replace("_", "").replace("-", "")
+
+
+class BundleIndex(Dict[str, zipfile.ZipInfo]):
+    """
+    Bundle entries keyed by path (see build_bundle_index), plus secondary indexes
+    used to suggest candidates for input paths that are missing in the bundle:
+      - by_basename: keys grouped by their final path component
+      - by_stem: keys grouped by normalize_stem() of their final path component
+      - stems: sorted list of by_stem keys, for prefix searches
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.by_basename: Dict[str, List[str]] = {}
+        self.by_stem: Dict[str, List[str]] = {}
+        self.stems: List[str] = []
+
+    def build_secondary(self) -> None:
+        self.by_basename.clear()
+        self.by_stem.clear()
+        for k in self:
+            name = k.rsplit("/", 1)[-1]
+            self.by_basename.setdefault(name, []).append(k)
+            self.by_stem.setdefault(normalize_stem(name), []).append(k)
+        self.stems = sorted(self.by_stem)
+
+
+def build_bundle_index(zbundle: zipfile.ZipFile) -> BundleIndex:
     """
     Index bundle entries by:
       - exact path
       - path with one leading top-level directory stripped
     """
-    index: Dict[str, zipfile.ZipInfo] = {}
+    index = BundleIndex()
 
     for info in zbundle.infolist():
         if info.is_dir():
@@ -103,13 +191,61 @@ def build_bundle_index(zbundle: zipfile.ZipFile) -> Dict[str, zipfile.ZipInfo]:
                 if len(index[k].filename) > len(info.filename):
                     index[k] = info
 
+    index.build_secondary()
     return index
 
 
-def find_suffix_candidates(bundle_keys: List[str], wanted: str, limit: int = 5) -> List[str]:
-    out = [k for k in bundle_keys if k.endswith(wanted)]
+def unique_entries(bundle_index: BundleIndex, keys: List[str]) -> List[str]:
+    """
+    Drop keys that point to the same bundle entry as an earlier key, since each entry is
+    indexed both with and without its top-level directory.
+    """
+    out: Dict[str, str] = {}
+    for k in keys:
+        out.setdefault(bundle_index[k].filename, k)
+    return list(out.values())
+
+
+def find_suffix_candidates(bundle_index: BundleIndex, wanted: str, limit: int = 5) -> List[str]:
+    # Any key ending with wanted shares its final path component
+    name = wanted.rsplit("/", 1)[-1]
+    out = [k for k in bundle_index.by_basename.get(name, ()) if k.endswith(wanted)]
     out.sort(key=len)
-    return out[:limit]
+    return unique_entries(bundle_index, out)[:limit]
+
+
+# Limits on the work done by find_fuzzy_candidates
+FUZZY_MIN_STEM = 3
+FUZZY_MAX_STEMS = 50
+
+
+def find_fuzzy_candidates(bundle_index: BundleIndex, wanted: str, limit: int = 5) -> List[str]:
+    """
+    Find bundle keys whose file name looks like a renamed version of wanted's, i.e. whose
+    normalized stem extends it (lsm6ds3 -> lsm6ds3trc) or is a shortened form of it.
+    Keys in the same directory as wanted are listed first.
+    """
+    stem = normalize_stem(wanted)
+    if len(stem) < FUZZY_MIN_STEM:
+        return []
+
+    stems = set()
+    # Stems that start with the wanted stem form a contiguous run of the sorted list
+    start = bisect.bisect_left(bundle_index.stems, stem)
+    for s in bundle_index.stems[start:start + FUZZY_MAX_STEMS]:
+        if not s.startswith(stem):
+            break
+        stems.add(s)
+    # Stems that the wanted stem starts with
+    for n in range(max(FUZZY_MIN_STEM, len(stem) // 2), len(stem)):
+        if stem[:n] in bundle_index.by_stem:
+            stems.add(stem[:n])
+
+    parent = wanted.rsplit("/", 1)[0] if "/" in wanted else ""
+    out = [k for s in stems for k in bundle_index.by_stem[s]]
+    out.sort(key=lambda k: (not k.rsplit("/", 1)[0].endswith(parent),
+                            abs(len(normalize_stem(k)) - len(stem)), len(k), k))
+    return unique_entries(bundle_index, out)[:limit]
 
 
 def is_macos_junk(rel_posix: str) -> bool:
@@ -126,93 +262,565 @@ def is_macos_junk(rel_posix: str) -> bool:
     return False
 
 
+# zipfile has no public API to set the compression level of a member written with
+# ZipFile.open(zinfo, "w"), or to add a member whose data is already compressed, so the three
+# functions below use its private state, and nothing else in this script does. They were tested
+# with CPython 3.11, and handle the rename of ZipInfo._compresslevel to compress_level in 3.13.
+# When an attribute they need is missing, set_compress_level() keeps the default level and
+# raw_copy_member() recompresses the member instead (see can_append_raw).
+_COMPRESS_LEVEL_ATTR = next(
+    (attr for attr in ("compress_level", "_compresslevel") if attr in getattr(zipfile.ZipInfo, "__slots__", ())), None)
+_RAW_APPEND_ATTRS = ("fp", "start_dir", "filelist", "NameToInfo", "_didModify")
+
+
+def set_compress_level(zinfo: zipfile.ZipInfo, level: int) -> None:
+    if _COMPRESS_LEVEL_ATTR is not None:
+        setattr(zinfo, _COMPRESS_LEVEL_ATTR, level)
+
+
+def can_append_raw(zsrc: zipfile.ZipFile, zout: zipfile.ZipFile) -> bool:
+    """
+    Return True if append_raw_member() can copy the raw data of zsrc members into zout.
+    """
+    return (hasattr(zsrc, "fp") and all(hasattr(zout, attr) for attr in _RAW_APPEND_ATTRS)
+            and not getattr(zout, "_writing", False))
+
+
+def append_raw_member(zsrc: zipfile.ZipFile, info: zipfile.ZipInfo, zout: zipfile.ZipFile, zinfo: zipfile.ZipInfo,
+                      chunk_size: int = CHUNK_SIZE) -> None:
+    """
+    Write the local header of zinfo then the compressed data of member info of zsrc into zout,
+    and register zinfo in the central directory the same way ZipFile.write() does.
+    """
+    zsrc.fp.seek(info.header_offset)
+    header = LOCAL_HEADER.unpack(zsrc.fp.read(LOCAL_HEADER.size))
+    if header[0] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Bad local header for '{info.filename}'")
+    # The local name and extra field lengths can differ from the central directory
+    zsrc.fp.seek(header[10] + header[11], os.SEEK_CUR)
+
+    zinfo.header_offset = zout.fp.tell()
+    zout.fp.write(zinfo.FileHeader())
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = zsrc.fp.read(min(chunk_size, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated data for '{info.filename}'")
+        zout.fp.write(chunk)
+        remaining -= len(chunk)
+
+    zout.start_dir = zout.fp.tell()
+    zout.filelist.append(zinfo)
+    zout.NameToInfo[zinfo.filename] = zinfo
+    zout._didModify = True
+
+
+def output_zipinfo(arcname: str) -> zipfile.ZipInfo:
+    """
+    Create the header of an output zip member with fixed timestamp, mode and compression.
+    """
+    zinfo = zipfile.ZipInfo(arcname, date_time=ZIP_DATE_TIME)
+    zinfo.create_system = ZIP_CREATE_SYSTEM
+    zinfo.external_attr = ZIP_FILE_MODE << 16
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    # Used by ZipFile.open(zinfo, "w"), which ignores the ZipFile compresslevel
+    set_compress_level(zinfo, ZIP_COMPRESSLEVEL)
+    return zinfo
+
+
 def create_output_zip_from_dir(out_dir: Path, output_zip_path: Path) -> None:
     """
     Zip the contents of out_dir into output_zip_path.
     - All archived paths must start with 'lib/'.
     - Omit macOS special files.
+    - Sorted entries with fixed metadata (see output_zipinfo).
     """
-    with zipfile.ZipFile(output_zip_path, "w", compression=zipfile.ZIP_DEFLATED) as zout:
-        for root, dirnames, filenames in os.walk(out_dir):
-            # Prune junk dirs early
-            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+    members = []
+    for root, dirnames, filenames in os.walk(out_dir):
+        # Prune junk dirs early
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
 
-            root_path = Path(root)
-            for fn in filenames:
-                full_path = root_path / fn
-                rel_path = full_path.relative_to(out_dir)
+        root_path = Path(root)
+        for fn in filenames:
+            full_path = root_path / fn
+            rel_path = full_path.relative_to(out_dir)
 
-                rel_posix = PurePosixPath(*rel_path.parts).as_posix()
+            rel_posix = PurePosixPath(*rel_path.parts).as_posix()
 
-                if not rel_posix.startswith("lib/"):
-                    # Enforce output zip layout rule
-                    continue
-                if is_macos_junk(rel_posix):
+            if not rel_posix.startswith("lib/"):
+                # Enforce output zip layout rule
+                continue
+            if is_macos_junk(rel_posix):
+                continue
+
+            members.append((rel_posix, full_path))
+
+    with zipfile.ZipFile(output_zip_path, "w", compression=zipfile.ZIP_DEFLATED,
+                         compresslevel=ZIP_COMPRESSLEVEL) as zout:
+        for rel_posix, full_path in sorted(members):
+            with open(full_path, "rb") as src, zout.open(output_zipinfo(rel_posix), "w") as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def iter_bundle_matches(
+    zin: zipfile.ZipFile, bundle_index: BundleIndex, missing: Optional[List[str]] = None, prefix: str = ""
+) -> Iterator[Tuple[PurePosixPath, zipfile.ZipInfo]]:
+    """
+    Yield (input path, bundle entry) pairs for each 'lib/' file of the input zip,
+    printing warnings for entries that are unsafe, misplaced or missing in the bundle.
+    Paths missing in the bundle are also appended to missing, when provided.
+    Warnings start with prefix, to tell apart the profiles of a multi-profile run.
+    """
+    for in_info in zin.infolist():
+        if in_info.is_dir():
+            continue
+
+        try:
+            in_path = safe_posix_path(in_info.filename)
+        except ValueError as e:
+            print(f"{prefix}Warning: {e}; skipping", file=sys.stderr)
+            continue
+
+        # Require input entries under lib/
+        if not (in_path.parts and in_path.parts[0] == "lib"):
+            print(f"{prefix}Warning: input entry not under 'lib/': '{in_info.filename}'; skipping", file=sys.stderr)
+            continue
+
+        wanted = in_path.as_posix()  # keep 'lib/' for matching
+        binfo = bundle_index.get(wanted)
+
+        if binfo is None:
+            print(f"{prefix}Warning: missing in bundle_zip: '{wanted}'; skipping", file=sys.stderr)
+            if missing is not None:
+                missing.append(wanted)
+            cands = find_suffix_candidates(bundle_index, wanted, limit=5)
+            if cands:
+                print(f"{prefix}  Candidates (bundle keys ending with wanted path):", file=sys.stderr)
+                for c in cands:
+                    print(f"{prefix}    {c}", file=sys.stderr)
+            else:
+                cands = find_fuzzy_candidates(bundle_index, wanted, limit=5)
+                if cands:
+                    print(f"{prefix}  Candidates (bundle keys with a similar file name):", file=sys.stderr)
+                    for c in cands:
+                        print(f"{prefix}    {c}", file=sys.stderr)
+            continue
+
+        yield in_path, binfo
+
+
+def extract_matches_to_dir(
+    zbundle: zipfile.ZipFile, matches: Iterator[Tuple[PurePosixPath, zipfile.ZipInfo]], out_dir: Path
+) -> None:
+    """
+    Extract each matched bundle entry into out_dir at its input path.
+    """
+    for in_path, binfo in matches:
+        out_path = out_dir / Path(*in_path.parts)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            with zbundle.open(binfo, "r") as src, open(out_path, "wb") as dst:
+                dst.write(src.read())
+            apply_mode_if_present(binfo, out_path)
+        except OSError as e:
+            print(f"Warning: failed writing '{out_path}': {e}; skipping", file=sys.stderr)
+
+
+def stream_member(zsrc: zipfile.ZipFile, info: zipfile.ZipInfo, zout: zipfile.ZipFile, arcname: str,
+                  chunk_size: int = CHUNK_SIZE) -> None:
+    """
+    Decompress one member of zsrc and recompress it into zout as arcname, one chunk at a time.
+    """
+    zinfo = output_zipinfo(arcname)
+    # Lets zipfile decide up front whether ZIP64 extensions are needed
+    zinfo.file_size = info.file_size
+
+    with zsrc.open(info, "r") as src, zout.open(zinfo, "w") as dst:
+        shutil.copyfileobj(src, dst, chunk_size)
+
+
+def can_raw_copy(info: zipfile.ZipInfo) -> bool:
+    return (info.compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+            and not info.flag_bits & FLAG_ENCRYPTED)
+
+
+def raw_copy_member(zsrc: zipfile.ZipFile, info: zipfile.ZipInfo, zout: zipfile.ZipFile, arcname: str,
+                    chunk_size: int = CHUNK_SIZE) -> None:
+    """
+    Copy the already-compressed data of one member of zsrc into zout as arcname,
+    without decompressing or recompressing it, or recompress it if this zipfile
+    does not have the internals needed (see can_append_raw).
+    """
+    if not can_append_raw(zsrc, zout):
+        stream_member(zsrc, info, zout, arcname, chunk_size)
+        return
+
+    zinfo = output_zipinfo(arcname)
+    zinfo.compress_type = info.compress_type
+    # CRC and sizes are known, so they go in the local header instead of a data descriptor
+    zinfo.flag_bits = info.flag_bits & ~FLAG_DATA_DESCRIPTOR
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+    append_raw_member(zsrc, info, zout, zinfo, chunk_size)
+
+
+def stream_matches_to_zip(
+    zbundle: zipfile.ZipFile,
+    matches: Iterator[Tuple[PurePosixPath, zipfile.ZipInfo]],
+    output_zip_path: Path,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """
+    Copy each matched bundle entry directly into output_zip_path, one chunk at a time.
+    - Same layout rules as create_output_zip_from_dir ('lib/' only, no macOS junk, sorted entries).
+    - Nothing is written to disk outside the output zip.
+    Returns the number of members written.
+    """
+    written = set()
+    with zipfile.ZipFile(output_zip_path, "w", compression=zipfile.ZIP_DEFLATED,
+                         compresslevel=ZIP_COMPRESSLEVEL) as zout:
+        for in_path, binfo in sorted(matches, key=lambda m: m[0].as_posix()):
+            rel_posix = in_path.as_posix()
+            if is_macos_junk(rel_posix) or rel_posix in written:
+                continue
+            stream_member(zbundle, binfo, zout, rel_posix, chunk_size)
+            written.add(rel_posix)
+
+    return len(written)
+
+
+def incremental_matches_to_zip(
+    zbundle: zipfile.ZipFile,
+    matches: Iterator[Tuple[PurePosixPath, zipfile.ZipInfo]],
+    output_zip_path: Path,
+    previous: List[zipfile.ZipFile],
+    chunk_size: int = CHUNK_SIZE,
+) -> Dict[str, int]:
+    """
+    Like stream_matches_to_zip, but members whose bundle CRC32 and size match an entry
+    with the same path in one of the previous zips (checked in order) are raw-copied from
+    that zip, so only changed members are recompressed.
+    Returns counts of 'changed' and 'unchanged' members written.
+    """
+    counts = {"changed": 0, "unchanged": 0}
+    written = set()
+    with zipfile.ZipFile(output_zip_path, "w", compression=zipfile.ZIP_DEFLATED,
+                         compresslevel=ZIP_COMPRESSLEVEL) as zout:
+        for in_path, binfo in sorted(matches, key=lambda m: m[0].as_posix()):
+            rel_posix = in_path.as_posix()
+            if is_macos_junk(rel_posix) or rel_posix in written:
+                continue
+
+            for zprev in previous:
+                try:
+                    pinfo = zprev.getinfo(rel_posix)
+                except KeyError:
                     continue
+                if pinfo.CRC == binfo.CRC and pinfo.file_size == binfo.file_size and can_raw_copy(pinfo):
+                    raw_copy_member(zprev, pinfo, zout, rel_posix, chunk_size)
+                    counts["unchanged"] += 1
+                    break
+            else:
+                stream_member(zbundle, binfo, zout, rel_posix, chunk_size)
+                counts["changed"] += 1
+            written.add(rel_posix)
+
+    return counts
+
+
+def profile_output_name(input_zip: str, version: str) -> str:
+    """
+    Name the output of one profile after its input, with the version tag replaced,
+    e.g. E4S-libraries-8.x-2024.zip -> E4S-libraries-10.x-2024.zip.
+    """
+    name = os.path.basename(input_zip)
+    out, n = PROFILE_VERSION_RE.subn(f"-{version}", name, count=1)
+    if not n:
+        raise ValueError(f"Could not find a version tag like '9.x' in: {input_zip}")
+    return out
+
+
+def load_manifest(manifest_path: str, version: str) -> List[Tuple[str, Path]]:
+    """
+    Read a JSON list of profiles like:
+
+        [{"input": "E4S-libraries-8.x-2024.zip"}, {"input": "E4S-airlift-lib-7.x.zip", "output": "airlift.zip"}]
+
+    Input paths are relative to the manifest file, output paths to the current directory.
+    Returns (input zip, output zip path) pairs. Raises ValueError if the manifest is empty or malformed.
+    """
+    with open(manifest_path) as f:
+        try:
+            profiles = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{manifest_path}: invalid JSON: {e}")
+    if not isinstance(profiles, list):
+        raise ValueError(f"{manifest_path}: expected a JSON list of profiles, got {type(profiles).__name__}")
+    if not profiles:
+        raise ValueError(f"{manifest_path}: no profiles listed")
+    base = Path(manifest_path).parent
+    out = []
+    for i, profile in enumerate(profiles):
+        if not isinstance(profile, dict) or not isinstance(profile.get("input"), str) or not profile["input"]:
+            raise ValueError(f"{manifest_path}: profile {i} must be an object with an 'input' zip name: {profile!r}")
+        output_name = profile.get("output")
+        if output_name is not None and (not isinstance(output_name, str) or not output_name):
+            raise ValueError(f"{manifest_path}: profile {i} has an invalid 'output' name: {output_name!r}")
+        input_zip = str(base / profile["input"])
+        out.append((input_zip, Path.cwd() / (output_name or profile_output_name(input_zip, version))))
+    return out
+
+
+def update_profile(
+    zbundle: zipfile.ZipFile,
+    bundle_index: BundleIndex,
+    input_zip: str,
+    output_zip_path: Path,
+    incremental: bool = False,
+    prefix: str = "",
+) -> str:
+    """
+    Write output_zip_path with the bundle versions of the library files in input_zip,
+    using stream_matches_to_zip or incremental_matches_to_zip. Returns a summary line.
+    """
+    missing: List[str] = []
+    with zipfile.ZipFile(input_zip, "r") as zin:
+        matches = iter_bundle_matches(zin, bundle_index, missing, prefix)
+        if not incremental:
+            nwritten = stream_matches_to_zip(zbundle, matches, output_zip_path)
+            return f'Created {output_zip_path} with {nwritten} library files'
+
+        # Write next to the previous output, which is only replaced once complete
+        tmp_zip_path = output_zip_path.with_name(output_zip_path.name + ".tmp")
+        previous = [zin]
+        if output_zip_path.exists():
+            previous.insert(0, zipfile.ZipFile(output_zip_path, "r"))
+        try:
+            counts = incremental_matches_to_zip(zbundle, matches, tmp_zip_path, previous)
+        finally:
+            for zprev in previous[:-1]:
+                zprev.close()
+        os.replace(tmp_zip_path, output_zip_path)
+
+    return (f'Created {output_zip_path}: {counts["changed"]} changed, '
+            f'{counts["unchanged"]} unchanged, {len(missing)} missing')
 
-                # Ensure stable timestamps? (optional; leaving as default)
-                zout.write(full_path, arcname=rel_posix)
+
+def file_sha256(path: str, chunk_size: int = CHUNK_SIZE) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_crc32(path: Path, chunk_size: int = CHUNK_SIZE) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def build_options(incremental: bool, output_zip_path: Path) -> Dict[str, object]:
+    """
+    Return the settings that change the bytes of an output zip, besides the input and bundle zips.
+    An incremental output reuses the compressed data of the previous output, so depends on it.
+    """
+    options: Dict[str, object] = {
+        "mode": "incremental" if incremental else "stream",
+        "compresslevel": ZIP_COMPRESSLEVEL,
+        "compress_level_attr": _COMPRESS_LEVEL_ATTR,
+        "date_time": ZIP_DATE_TIME,
+        "file_mode": ZIP_FILE_MODE,
+        "create_system": ZIP_CREATE_SYSTEM,
+    }
+    if incremental and output_zip_path.exists():
+        options["previous"] = file_sha256(str(output_zip_path))
+    return options
+
+
+def cache_path(cache_dir: Path, input_zip: str, bundle_hash: str, options: Dict[str, object]) -> Path:
+    """
+    Path of the cached output for input_zip, keyed by the contents of the input and bundle zips,
+    and by the build options (see build_options).
+    """
+    settings = json.dumps(options, sort_keys=True)
+    key = hashlib.sha256(f"{CACHE_FORMAT}:{file_sha256(input_zip)}:{bundle_hash}:{settings}".encode()).hexdigest()
+    return cache_dir / f"{key}.zip"
+
+
+def store_in_cache(output_zip_path: Path, cached_path: Path) -> None:
+    # Copy then rename, so that concurrent runs never see a partial cache entry
+    tmp_path = cached_path.with_name(f"{cached_path.name}.{os.getpid()}.tmp")
+    shutil.copyfile(output_zip_path, tmp_path)
+    os.replace(tmp_path, cached_path)
+
+
+# Per-process state of the update_profile workers used with --jobs
+_worker_bundle: Optional[zipfile.ZipFile] = None
+_worker_index: Optional[BundleIndex] = None
+
+
+def _init_worker(bundle_zip: str, bundle_index: BundleIndex) -> None:
+    global _worker_bundle, _worker_index
+    _worker_bundle = zipfile.ZipFile(bundle_zip, "r")
+    _worker_index = bundle_index
+
+
+def _update_profile_worker(input_zip: str, output_zip_path: Path, incremental: bool, prefix: str) -> str:
+    return update_profile(_worker_bundle, _worker_index, input_zip, output_zip_path, incremental, prefix)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Generate an updated E4S-libraries-<version>.zip from a CircuitPython bundle zip.")
+    parser.add_argument(
+        "input_zip", nargs="*",
+        help="existing E4S-libraries-<version>.zip to update (several profiles can be listed)")
+    parser.add_argument("bundle_zip", help="CircuitPython bundle zip with the new library versions")
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="copy library files straight from the bundle into the output zip, without a temporary directory")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="like --stream, but reuse the compressed data of files that are unchanged in the "
+             "previous output zip or the input zip, and print a summary")
+    parser.add_argument(
+        "--manifest", metavar="JSON",
+        help="JSON list of profiles to update, each with an 'input' zip and an optional 'output' name")
+    parser.add_argument(
+        "--cache-dir", metavar="DIR",
+        help="reuse output zips cached in DIR, keyed by the contents of the input and bundle zips")
+    parser.add_argument(
+        "--jobs", type=int, default=1, metavar="N",
+        help="number of worker processes used to write the outputs of several profiles")
+    args = parser.parse_args()
+    if not args.input_zip and not args.manifest:
+        parser.error("at least one input zip or a --manifest is required")
+    return args
+
+
+def update_profiles(
+    profiles: List[Tuple[str, Path]], bundle_zip: str, incremental: bool, jobs: int, cache_dir: Optional[Path]
+) -> bool:
+    """
+    Write the output zip of each (input zip, output zip path) profile, indexing the bundle only once,
+    and print a summary line for each. Returns False if any profile failed.
+    """
+    prefixes = [f"{input_zip}: " if len(profiles) > 1 else "" for input_zip, _ in profiles]
+    results: Dict[int, object] = {}
+    cached_paths: Dict[int, Path] = {}
+
+    if cache_dir is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        bundle_hash = file_sha256(bundle_zip)
+        for i, (input_zip, output_zip_path) in enumerate(profiles):
+            try:
+                options = build_options(incremental, output_zip_path)
+                cached_paths[i] = cache_path(cache_dir, input_zip, bundle_hash, options)
+                if cached_paths[i].exists():
+                    shutil.copyfile(cached_paths[i], output_zip_path)
+                    results[i] = f'Created {output_zip_path} from cache {cached_paths[i]}'
+            except OSError as e:
+                results[i] = e
+
+    todo = [i for i in range(len(profiles)) if i not in results]
+    if todo:
+        # Index the bundle once and share it between all profiles
+        with zipfile.ZipFile(bundle_zip, "r") as zbundle:
+            bundle_index = build_bundle_index(zbundle)
+            if jobs > 1 and len(todo) > 1:
+                with ProcessPoolExecutor(
+                    max_workers=jobs, initializer=_init_worker, initargs=(bundle_zip, bundle_index)
+                ) as pool:
+                    futures = {
+                        i: pool.submit(_update_profile_worker, *profiles[i], incremental, prefixes[i])
+                        for i in todo}
+                    for i, future in futures.items():
+                        try:
+                            results[i] = future.result()
+                        except (OSError, zipfile.BadZipFile) as e:
+                            results[i] = e
+            else:
+                for i in todo:
+                    try:
+                        results[i] = update_profile(
+                            zbundle, bundle_index, *profiles[i], incremental, prefixes[i])
+                    except (OSError, zipfile.BadZipFile) as e:
+                        results[i] = e
+
+    ok = True
+    for i, (input_zip, output_zip_path) in enumerate(profiles):
+        result = results[i]
+        if i in todo and i in cached_paths and not isinstance(result, Exception):
+            try:
+                store_in_cache(output_zip_path, cached_paths[i])
+            except OSError as e:
+                print(f"Warning: failed caching '{output_zip_path}': {e}", file=sys.stderr)
+        if isinstance(result, Exception):
+            print(f"Error: failed updating '{input_zip}': {result}", file=sys.stderr)
+            ok = False
+        else:
+            print(result)
+    return ok
 
 
 def main() -> None:
-    if len(sys.argv) != 3:
-        print(f"Usage: {sys.argv[0]} <input.zip> <bundle.zip>", file=sys.stderr)
-        sys.exit(1)
+    args = parse_args()
 
-    input_zip = sys.argv[1]
-    bundle_zip = sys.argv[2]
+    bundle_zip = args.bundle_zip
 
     try:
         version = extract_version(bundle_zip)
-    except ValueError as e:
+        if args.manifest:
+            profiles = load_manifest(args.manifest, version)
+            profiles += [(z, Path.cwd() / profile_output_name(z, version)) for z in args.input_zip]
+        elif len(args.input_zip) > 1:
+            profiles = [(z, Path.cwd() / profile_output_name(z, version)) for z in args.input_zip]
+        else:
+            profiles = []
+    except (OSError, ValueError) as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
+    input_zip = args.input_zip[0] if args.input_zip else None
     output_zip_name = f"E4S-libraries-{version}.zip"
+    output_zip_path = Path.cwd() / output_zip_name
+
+    if not profiles and (args.stream or args.incremental or args.cache_dir):
+        profiles = [(input_zip, output_zip_path)]
+
+    if profiles:
+        outputs = [output for _, output in profiles]
+        if len(set(outputs)) != len(outputs):
+            print("Error: several profiles would write the same output zip", file=sys.stderr)
+            sys.exit(1)
+
+        cache_dir = Path(args.cache_dir) if args.cache_dir else None
+        try:
+            ok = update_profiles(profiles, bundle_zip, args.incremental, args.jobs, cache_dir)
+        except FileNotFoundError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        except zipfile.BadZipFile as e:
+            print(f"Error: bad zip file: {e}", file=sys.stderr)
+            sys.exit(1)
+        except OSError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        if not ok:
+            sys.exit(1)
+        return
 
     out_dir = Path(tempfile.mkdtemp(prefix=f"E4S-libraries-{version}-"))
 
     try:
         with zipfile.ZipFile(input_zip, "r") as zin, zipfile.ZipFile(bundle_zip, "r") as zbundle:
             bundle_index = build_bundle_index(zbundle)
-            bundle_keys = list(bundle_index.keys())
-
-            for in_info in zin.infolist():
-                if in_info.is_dir():
-                    continue
-
-                try:
-                    in_path = safe_posix_path(in_info.filename)
-                except ValueError as e:
-                    print(f"Warning: {e}; skipping", file=sys.stderr)
-                    continue
-
-                # Require input entries under lib/
-                if not (in_path.parts and in_path.parts[0] == "lib"):
-                    print(f"Warning: input entry not under 'lib/': '{in_info.filename}'; skipping", file=sys.stderr)
-                    continue
-
-                wanted = in_path.as_posix()  # keep 'lib/' for matching
-                binfo = bundle_index.get(wanted)
-
-                if binfo is None:
-                    print(f"Warning: missing in bundle_zip: '{wanted}'; skipping", file=sys.stderr)
-                    cands = find_suffix_candidates(bundle_keys, wanted, limit=5)
-                    if cands:
-                        print("  Candidates (bundle keys ending with wanted path):", file=sys.stderr)
-                        for c in cands:
-                            print(f"    {c}", file=sys.stderr)
-                    continue
-
-                out_path = out_dir / Path(*in_path.parts)
-                out_path.parent.mkdir(parents=True, exist_ok=True)
-
-                try:
-                    with zbundle.open(binfo, "r") as src, open(out_path, "wb") as dst:
-                        dst.write(src.read())
-                    apply_mode_if_present(binfo, out_path)
-                except OSError as e:
-                    print(f"Warning: failed writing '{out_path}': {e}; skipping", file=sys.stderr)
+            extract_matches_to_dir(zbundle, iter_bundle_matches(zin, bundle_index), out_dir)
 
     except FileNotFoundError as e:
         print(f"Error: {e}", file=sys.stderr)
@@ -222,7 +830,6 @@ def main() -> None:
         sys.exit(1)
 
     # Create the target output zip from temp dir contents
-    output_zip_path = Path.cwd() / output_zip_name
     try:
         create_output_zip_from_dir(out_dir, output_zip_path)
     except OSError as e:
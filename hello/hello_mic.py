@@ -16,6 +16,10 @@
 # The electret module is more sensitive than the MEMS module since it includes an
 # amplifier.  It also has about double the resolution since it provides a DC offset
 # of 50% full scale, instead of about 22% fullscale for the MEMS module.
+#
+# The following file must be copied to your CIRCUITPY lib/ folder:
+#
+#  e4s_capture.py (from the lib/ folder of https://github.com/dkirkby/E4S)
 
 import time
 import math
@@ -23,26 +27,28 @@ import math
 import board
 import analogio
 
+import ulab.numpy as np
+
+# This file is not in the base CircuitPython installation.
+# See instructions above for installing it.
+from e4s_capture import Capture
+
 LOG10 = math.log(10)
 NSAMPLES = 1024
 FULLSCALE = float(0xffff)
 
 mic = analogio.AnalogIn(board.A0)
 
+# Samples are captured into the same preallocated buffer every time.
+capture = Capture(mic, NSAMPLES)
+
 while True:
-    start = time.monotonic_ns()
-    samples = [mic.value for i in range(NSAMPLES)]
-    stop = time.monotonic_ns()
+    capture.read()
     # Calculate sampling rate in kHz
-    sampling_rate = 1e6 * NSAMPLES / (stop - start)
+    sampling_rate = 1e-3 * capture.rate
     # Calculate mean and standard deviation of samples in ADU.
-    sum, sumsq = 0, 0
-    for i in range(NSAMPLES):
-        value = samples[i]
-        sum += value
-        sumsq += value * value
-    mean = sum / NSAMPLES
-    stddev = math.sqrt(sumsq / NSAMPLES - mean * mean)
+    mean = np.mean(capture.values)
+    stddev = np.std(capture.values)
     # Convert to percentages of full scale.
     mean *= 100 / FULLSCALE
     stddev *= 100 / FULLSCALE
@@ -9,6 +9,7 @@
 #  adafruit_as7341.mpy
 #  adafruit_bus_device/*
 #  adafruit_register/*
+#  e4s_autoexposure.py (from the lib/ folder of https://github.com/dkirkby/E4S)
 #
 # See https://github.com/adafruit/Adafruit_CircuitPython_AS7341
 # for details on the AS7341 library and examples.
@@ -36,12 +37,10 @@ i2c = busio.I2C(sda=sda, scl=scl)
 # These files are not in the base CircuitPython installation.
 # See instructions above for installing them.
 import adafruit_as7341
+from e4s_autoexposure import AutoExposure
 
 multispec = adafruit_as7341.AS7341(i2c)
 
-# Use a gain of 256X to match most of the curves in Fig.18 of the datasheet.
-multispec.gain = adafruit_as7341.Gain.GAIN_256X
-
 # List the available bands.
 bands = ['415nm','445nm','480nm','515nm','555nm','590nm','630nm','680nm','clear','nir']
 
@@ -56,6 +55,14 @@ multispec.led = USE_LED
 # Disable flicker detection.
 multispec.flicker_detection_enabled = False
 
+# Choose the gain and integration time of each reading automatically, to avoid saturating
+# in bright light and to read faster. Fluxes are in counts per unit gain per ms.
+auto = AutoExposure(multispec, read_channels=lambda: [getattr(multispec, 'channel_' + band) for band in bands])
+
+# Scale fluxes to the counts of a reading with a gain of 256X, which matches most of the
+# curves in Fig.18 of the datasheet, and the default integration time of 281ms.
+REF_EXPOSURE = 256 * 281
+
 # Display a simple horizontal histogram using text.
 LINE_LENGTH = 120
 
@@ -68,9 +75,11 @@ def bar(value, max_value=10000, max_length=LINE_LENGTH - 11):
 # Main loop reads sensors and displays the measured spectrum.
 LOG2 = math.log(2)
 while True:
-    fluxes = [getattr(multispec, 'channel_' + band) for band in bands]
+    gain, time_ms = auto.gain, auto.time_ms
+    fluxes = [REF_EXPOSURE * flux for flux in auto.read()]
     log2_fluxes = [math.log(max(1,flux)) / LOG2 for flux in fluxes]
     for i, band in enumerate(bands):
-        print(f'{band:5s} {fluxes[i]:04x} {bar(log2_fluxes[i], max_value=16)}')
+        print(f'{band:5s} {fluxes[i]:8.0f} {bar(log2_fluxes[i], max_value=16)}')
+    print(f'gain {gain:g}X, {time_ms:.1f}ms')
     print(separator)
     time.sleep(0.5)
@@ -7,26 +7,43 @@
 # GND = GND
 # TRIG = GP21
 # ECHO = GP22
+#
+# Requires this file in your CIRCUITPY lib/ folder:
+#  e4s_sonar.py (from the lib/ folder of https://github.com/dkirkby/E4S)
+# Optionally also copy asyncio/ and adafruit_ticks.mpy from the CircuitPython library bundle
+# to ping in the background, while other tasks run.
 import time
 import board
-import adafruit_hcsr04
+from e4s_sonar import Sonar
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+# Ping every 0.1s and filter out bad echoes and timeouts.
+# See lib/e4s_sonar.py for details.
+PERIOD = 0.1
+sonar = Sonar(trigger_pin=board.GP21, echo_pin=board.GP22, period=PERIOD)
+
+def report():
+    # The distance is None until a ping returns an echo, and whenever all recent pings timed out.
+    if sonar.distance is not None:
+        print((sonar.distance,))
 
-# See https://learn.adafruit.com/ultrasonic-sonar-distance-sensors/python-circuitpython
-sonar = adafruit_hcsr04.HCSR04(trigger_pin=board.GP21, echo_pin=board.GP22)
+if asyncio:
+    async def print_loop():
+        while True:
+            report()
+            await asyncio.sleep(PERIOD)
 
-NAVG = 16
+    async def main():
+        await asyncio.gather(sonar.run(), print_loop())
 
-while True:
-    distance = 0.
-    nsamples = 0
-    for i in range(NAVG):
-        # The measurement will sometimes time out, resulting in a RuntimeError.
-        # Therefore we cannot assume we will get NAVG samples and must count them.
-        try:
-            distance += sonar.distance
-            nsamples += 1
-        except RuntimeError:
-            pass
-    distance /= nsamples
-    print((distance,))
-    time.sleep(0.1)
+    asyncio.run(main())
+else:
+    # Without asyncio, wait for each echo in turn.
+    while True:
+        sonar.update()
+        report()
+        time.sleep(PERIOD)
@@ -0,0 +1,150 @@
+# UCI Electronics for Scientists
+# https://github.com/dkirkby/E4S
+#
+# Automatically adjust the gain and integration time of the AS7341 multispectral sensor.
+#
+# Copy this file to your CIRCUITPY lib/ folder, then use it like this:
+#
+#   from e4s_autoexposure import AutoExposure
+#
+#   multispec = adafruit_as7341.AS7341(i2c)
+#   auto = AutoExposure(multispec)
+#   while True:
+#       fluxes = auto.read()
+#       print(fluxes, auto.gain, auto.time_ms)
+#
+# A fixed gain either saturates in bright light (e.g. GAIN_256X in sunlight) or wastes most of
+# the 16-bit range and needs long readings in dim light (e.g. GAIN_2X indoors). An AutoExposure
+# instead chooses the settings of each reading from the peak channel of the previous one.
+#
+# The sensor integrates for (ATIME + 1) * (ASTEP + 1) steps of 2.78us, and its counts saturate at
+# min(65535, steps). The counts of a channel are r * gain * steps, where r is its flux in counts
+# per unit gain per step, so for readings up to 65535 steps (182ms), the fraction of the saturation
+# level, r * gain, only depends on the gain. The controller therefore uses the highest gain that
+# keeps the peak channel below target of the saturation level, then the shortest integration time
+# that still gives min_counts in the peak channel, for enough resolution. In bright light, this
+# gives readings of a few ms. In dim light, when even the highest gain (512X) does not reach half
+# of target, the integration time is increased beyond 65535 steps, where the saturation level
+# stops increasing, until the peak reaches target of it, up to max_ms. When a reading is
+# saturated, the next one uses a much lower gain, since the flux can then be arbitrarily large.
+#
+# Fluxes are returned in counts per unit gain per ms, so they can be compared between readings
+# with different settings.
+#
+# FakeAS7341 stands in for the sensor under regular python, for testing.
+
+STEP_MS = 2.78e-3
+MAX_COUNTS = 65535
+MAX_ATIME = 255
+MAX_ASTEP = 65534
+# Gain codes of the AS7341 (the values of adafruit_as7341.Gain) are 0.5X, 1X, 2X, ... 512X.
+GAINS = [0.5 * (1 << code) for code in range(11)]
+
+
+def full_scale(steps):
+    # Counts where readings of this number of steps saturate.
+    return min(MAX_COUNTS, steps)
+
+
+def split_steps(steps):
+    # Return (ATIME, ASTEP) with (ATIME + 1) * (ASTEP + 1) close to steps.
+    atime = min(MAX_ATIME, (steps - 1) // (MAX_ASTEP + 1))
+    astep = min(MAX_ASTEP, max(0, round(steps / (atime + 1)) - 1))
+    return atime, astep
+
+
+class AutoExposure:
+
+    def __init__(self, sensor, target=0.5, min_counts=1000, max_ms=500., saturated=0.9, read_channels=None):
+        # target and saturated are fractions of the saturation level.
+        # read_channels() returns the counts of each channel, by default sensor.all_channels.
+        self.sensor = sensor
+        self.target = target
+        self.min_counts = min_counts
+        self.max_steps = int(max_ms / STEP_MS)
+        self.saturated = saturated
+        self.read_channels = read_channels or (lambda: sensor.all_channels)
+        # Start in the middle of the range.
+        self.set(5, 36000)
+        self.nsaturated = 0
+
+    def set(self, gain_code, steps):
+        # Apply new settings to the sensor.
+        steps = max(1, min(self.max_steps, int(steps)))
+        self.gain_code = gain_code
+        self.atime, self.astep = split_steps(steps)
+        self.steps = (self.atime + 1) * (self.astep + 1)
+        sensor = self.sensor
+        sensor.gain = gain_code
+        sensor.atime = self.atime
+        sensor.astep = self.astep
+
+    @property
+    def gain(self):
+        return GAINS[self.gain_code]
+
+    @property
+    def time_ms(self):
+        # Integration time of the current settings.
+        return self.steps * STEP_MS
+
+    def update(self, counts):
+        # Return the fluxes of a reading taken with the current settings and choose the next ones.
+        gain, steps = self.gain, self.steps
+        scale = 1 / (gain * steps * STEP_MS)
+        fluxes = [c * scale for c in counts]
+        peak = max(counts)
+        if peak >= self.saturated * full_scale(steps):
+            # The flux could be much larger, so reduce the exposure a lot.
+            self.nsaturated += 1
+            rate = 16 * max(1, peak) / (gain * steps)
+        else:
+            # Counts of the peak channel per unit gain per step, at least one count.
+            rate = max(1, peak) / (gain * steps)
+        # Highest gain that keeps the peak below target of the saturation level, i.e.
+        # rate * gain * steps <= target * steps.
+        code = 0
+        for i in range(len(GAINS)):
+            if rate * GAINS[i] <= self.target:
+                code = i
+        per_step = rate * GAINS[code]
+        if code == len(GAINS) - 1 and per_step < self.target / 2:
+            # Dim light: integrate beyond 65535 steps until the peak reaches target of 65535.
+            steps = self.target * MAX_COUNTS / per_step
+        else:
+            # Shortest time with min_counts in the peak channel.
+            steps = self.min_counts / per_step
+        self.set(code, steps + 1)
+        return fluxes
+
+    def read(self):
+        # Take one reading and return its fluxes in counts per unit gain per ms.
+        return self.update(self.read_channels())
+
+
+class FakeAS7341:
+
+    def __init__(self, fluxes):
+        # fluxes are the counts per unit gain per ms of each channel, which can be changed.
+        self.fluxes = fluxes
+        self.gain = 5
+        self.atime = 100
+        self.astep = 999
+
+    @property
+    def all_channels(self):
+        steps = (self.atime + 1) * (self.astep + 1)
+        exposure = GAINS[self.gain] * steps * STEP_MS
+        return [min(full_scale(steps), int(f * exposure)) for f in self.fluxes]
+
+
+if __name__ == '__main__':
+    # Step from dim to bright light and back.
+    sensor = FakeAS7341([0.])
+    auto = AutoExposure(sensor)
+    for flux in (0.01, 1., 100., 1e4, 1.):
+        sensor.fluxes = [flux / 2, flux]
+        for i in range(3):
+            gain, time_ms = auto.gain, auto.time_ms
+            fluxes = auto.read()
+            print(f'flux {flux:g}: measured {fluxes[1]:.4g} with {gain:g}X {time_ms:.1f}ms')
@@ -0,0 +1,320 @@
+# UCI Electronics for Scientists
+# https://github.com/dkirkby/E4S
+#
+# Capture blocks of ADC samples into a preallocated buffer.
+#
+# Copy this file to your CIRCUITPY lib/ folder, then use it like this:
+#
+#   import board
+#   import analogio
+#   from e4s_capture import Capture
+#
+#   mic = analogio.AnalogIn(board.A0)
+#   capture = Capture(mic, 1024)
+#   while True:
+#       samples = capture.read()
+#       print(f'{capture.rate / 1e3:.1f} kHz')
+#
+# Building a new list with [mic.value for i in range(NSAMPLES)] allocates memory on every
+# capture, which eventually triggers a garbage collection pause and slows down sampling.
+# A Capture fills the same array('H') of 16-bit unsigned values in place every time instead.
+# The samples are also available as a ulab array that shares the same memory, so statistics
+# can be calculated with fast vectorized ulab calls, e.g. np.mean(capture.values).
+#
+# The adc can be any object with a 16-bit "value" attribute, so this module also runs under
+# regular python (with numpy instead of ulab) using a fake ADC for testing.
+#
+# Sampling "as fast as possible" gives a rate that jitters with every capture. On boards with
+# the analogbufio module (e.g. the Pico), use a Stream instead, where the ADC hardware samples
+# at a fixed rate, so the FFT frequency axis f[i] = i * sample_rate / nsamples is exact:
+#
+#   import analogbufio
+#   from e4s_capture import Stream
+#
+#   stream = Stream(analogbufio.BufferedIn(board.A0, sample_rate=50000), 1024, 50000)
+#   while True:
+#       values = stream.read()
+#       ...analyze values...
+#       print(f'{stream.dropped} dropped buffers')
+#
+# A Stream alternates between two buffers, so the values returned by one read() are not
+# overwritten by the next read() and can still be compared with, or averaged into, the next
+# block. Reading blocks until the ADC has filled the next buffer, and any samples that arrive
+# while the previous buffer is being analyzed are lost. The Stream measures these gaps and
+# counts the buffers they are equivalent to as "dropped", so you can check whether your
+# analysis keeps up with the sample rate. FakeBufferedIn stands in for analogbufio.BufferedIn
+# under regular python, generating samples of any signal with the same real-time behavior.
+#
+# To measure the response to an event, such as a click of the speaker in the Pulse project, use
+# a TriggeredCapture that records npre samples before the trigger and npost samples from it:
+#
+#   from e4s_capture import TriggeredCapture
+#
+#   def click():
+#       speaker.value = True
+#       speaker.value = False
+#
+#   capture = TriggeredCapture(mic, 20, 100)
+#   for i in range(16):
+#       capture.read(click)
+#       capture.accumulate()
+#   times_ns, waveform = capture.average()
+#
+# With a software trigger, read(fire) fills the pre-trigger buffer, calls fire() and uses the time
+# when it returns as the trigger. Without one, read() keeps sampling into a circular pre-trigger
+# buffer until a sample differs from the baseline (by default the mean of the pre-trigger samples)
+# by more than threshold ADU, which becomes the first post-trigger sample. The time of each sample
+# relative to the trigger is recorded, since sampling in a python loop is not exactly periodic,
+# at the cost of a lower sampling rate. Each accumulate() adds the samples and their times to
+# preallocated sums, so average() returns the waveform of the aligned responses, where the
+# noise is reduced by sqrt(naverage), together with the average time of each sample.
+
+import time
+import array
+
+try:
+    import ulab.numpy as np
+except ImportError:
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+
+class Capture:
+
+    def __init__(self, adc, nsamples):
+        self.adc = adc
+        self.nsamples = nsamples
+        # Preallocate the sample buffer once.
+        self.samples = array.array('H', bytes(2 * nsamples))
+        # A ulab (or numpy) view of the same memory, updated by each capture.
+        self.values = np.frombuffer(self.samples, dtype=np.uint16) if np else None
+        # Timing of the most recent capture in nanoseconds.
+        self.start_ns = 0
+        self.stop_ns = 0
+        self.ncaptures = 0
+
+    def read(self):
+        # Use local variables to avoid attribute lookups inside the loop.
+        adc = self.adc
+        samples = self.samples
+        start = time.monotonic_ns()
+        for i in range(self.nsamples):
+            samples[i] = adc.value
+        self.stop_ns = time.monotonic_ns()
+        self.start_ns = start
+        self.ncaptures += 1
+        return samples
+
+    @property
+    def duration_ns(self):
+        return self.stop_ns - self.start_ns
+
+    @property
+    def rate(self):
+        # Achieved sampling rate of the most recent capture in Hz.
+        duration = self.duration_ns
+        return 1e9 * self.nsamples / duration if duration > 0 else 0.
+
+    @property
+    def dt_ns(self):
+        # Average time between samples of the most recent capture in nanoseconds.
+        return self.duration_ns / self.nsamples
+
+
+class Stream:
+
+    def __init__(self, adc, nsamples, sample_rate):
+        # adc must have a readinto(buffer) method like analogbufio.BufferedIn.
+        self.adc = adc
+        self.nsamples = nsamples
+        self.sample_rate = sample_rate
+        self.block_ns = 1e9 * nsamples / sample_rate
+        # Preallocate two buffers that are filled alternately.
+        self.buffers = [array.array('H', bytes(2 * nsamples)) for i in range(2)]
+        self.views = [np.frombuffer(b, dtype=np.uint16) if np else b for b in self.buffers]
+        self.index = 0
+        # Timing of the most recent block in nanoseconds.
+        self.start_ns = 0
+        self.stop_ns = 0
+        # Statistics of the stream so far.
+        self.nblocks = 0
+        self.ngaps = 0
+        self.lost_ns = 0
+        self.dropped = 0
+
+    def read(self):
+        index = self.index
+        self.index = 1 - index
+        start = time.monotonic_ns()
+        self.adc.readinto(self.buffers[index])
+        stop = time.monotonic_ns()
+        if self.nblocks > 0:
+            # Time spent outside of readinto is not sampled, so count it as lost.
+            # Gaps shorter than one sample are just the overhead of restarting the ADC.
+            gap = start - self.stop_ns
+            if gap * self.sample_rate > 1e9:
+                self.ngaps += 1
+                self.lost_ns += gap
+                self.dropped = int(self.lost_ns // self.block_ns)
+        self.start_ns = start
+        self.stop_ns = stop
+        self.nblocks += 1
+        return self.views[index]
+
+    @property
+    def duty_cycle(self):
+        # Fraction of the elapsed time that was sampled.
+        total = self.nblocks * self.block_ns + self.lost_ns
+        return self.nblocks * self.block_ns / total if total > 0 else 0.
+
+
+class FakeBufferedIn:
+
+    def __init__(self, signal, sample_rate):
+        # signal(t) returns the ADC value (0-0xffff) at time t in seconds since creation.
+        self.signal = signal
+        self.sample_rate = sample_rate
+        self.t0_ns = time.monotonic_ns()
+
+    def readinto(self, buffer, loop=False):
+        # Start sampling from the current time, like the hardware.
+        rate = self.sample_rate
+        k0 = (time.monotonic_ns() - self.t0_ns) * rate // 1000000000
+        for i in range(len(buffer)):
+            buffer[i] = min(0xffff, max(0, int(self.signal((k0 + i) / rate))))
+        # Return only once the last sample would have been converted.
+        done_ns = self.t0_ns + (k0 + len(buffer)) * 1000000000 // rate
+        while time.monotonic_ns() < done_ns:
+            pass
+        return len(buffer)
+
+    def deinit(self):
+        pass
+
+
+class TriggeredCapture:
+
+    def __init__(self, adc, npre, npost, threshold=None, baseline=None, timeout=1.):
+        # threshold and baseline are in ADU and timeout in seconds, for read() without fire.
+        if threshold is not None and npre < 1 and baseline is None:
+            raise ValueError('a threshold trigger needs npre > 0 or a baseline')
+        if threshold is not None and npost < 1:
+            # The sample that crosses the threshold is the first post-trigger sample.
+            raise ValueError('a threshold trigger needs npost > 0')
+        if timeout > 2:
+            # Sample times are stored as 32-bit nanoseconds.
+            raise ValueError('timeout must be at most 2 seconds')
+        self.adc = adc
+        self.npre = npre
+        self.npost = npost
+        self.nsamples = nsamples = npre + npost
+        self.threshold = threshold
+        self.baseline = baseline
+        self.timeout_ns = int(1e9 * timeout)
+        # Preallocate the circular pre-trigger buffer and the aligned samples, with the time of
+        # each sample in nanoseconds since read() started.
+        self.ring = array.array('H', bytes(2 * max(1, npre)))
+        self.ring_ns = array.array('l', [0] * max(1, npre))
+        self.samples = array.array('H', bytes(2 * nsamples))
+        self.sample_ns = array.array('l', [0] * nsamples)
+        self.values = np.frombuffer(self.samples, dtype=np.uint16) if np else None
+        # Time of each sample relative to the trigger in nanoseconds, after read().
+        self.times = np.zeros(nsamples) if np else [0.] * nsamples
+        # Sums of aligned captures.
+        self.total = np.zeros(nsamples) if np else [0.] * nsamples
+        self.total_ns = np.zeros(nsamples) if np else [0.] * nsamples
+        self.naverage = 0
+        self.ncaptures = 0
+        self.ntimeouts = 0
+
+    def read(self, fire=None):
+        # Capture one triggered response. Returns False if the threshold trigger timed out.
+        if fire is None and self.threshold is None:
+            raise ValueError('read() needs a fire function, or a threshold passed to TriggeredCapture')
+        adc = self.adc
+        monotonic_ns = time.monotonic_ns
+        ring, ring_ns = self.ring, self.ring_ns
+        npre = self.npre
+        start = monotonic_ns()
+        # Fill the pre-trigger buffer once.
+        for i in range(npre):
+            ring[i] = adc.value
+            ring_ns[i] = monotonic_ns() - start
+        j = 0
+        samples, sample_ns = self.samples, self.sample_ns
+        k = npre
+        if fire is not None:
+            fire()
+            trigger_ns = monotonic_ns() - start
+        else:
+            baseline = self.baseline
+            if baseline is None:
+                baseline = sum(ring) / npre
+            lo, hi = baseline - self.threshold, baseline + self.threshold
+            timeout_ns = self.timeout_ns
+            while True:
+                value = adc.value
+                t = monotonic_ns() - start
+                if value < lo or value > hi:
+                    break
+                if t > timeout_ns:
+                    self.ntimeouts += 1
+                    return False
+                if npre:
+                    ring[j] = value
+                    ring_ns[j] = t
+                    j += 1
+                    if j == npre:
+                        j = 0
+            trigger_ns = t
+            samples[k] = value
+            sample_ns[k] = t
+            k += 1
+        # Record the post-trigger samples.
+        for i in range(k, self.nsamples):
+            samples[i] = adc.value
+            sample_ns[i] = monotonic_ns() - start
+        # Copy the pre-trigger samples, oldest first.
+        for i in range(npre):
+            samples[i] = ring[j]
+            sample_ns[i] = ring_ns[j]
+            j += 1
+            if j == npre:
+                j = 0
+        times = self.times
+        for i in range(self.nsamples):
+            times[i] = sample_ns[i] - trigger_ns
+        self.ncaptures += 1
+        return True
+
+    def accumulate(self):
+        # Add the most recent capture to the sums.
+        if np:
+            self.total += self.values
+            self.total_ns += self.times
+        else:
+            total, total_ns, samples, times = self.total, self.total_ns, self.samples, self.times
+            for i in range(self.nsamples):
+                total[i] += samples[i]
+                total_ns[i] += times[i]
+        self.naverage += 1
+
+    def average(self):
+        # Return the average time in ns relative to the trigger and the average ADU of each sample,
+        # as arrays, or lists without ulab or numpy.
+        n = max(1, self.naverage)
+        if np:
+            return self.total_ns / n, self.total / n
+        return [t / n for t in self.total_ns], [v / n for v in self.total]
+
+    def reset(self):
+        # Start a new average.
+        for total in (self.total, self.total_ns):
+            if np:
+                total[:] = 0
+            else:
+                for i in range(self.nsamples):
+                    total[i] = 0.
+        self.naverage = 0
@@ -0,0 +1,261 @@
+# UCI Electronics for Scientists
+# https://github.com/dkirkby/E4S
+#
+# Digital signal processing chain of the DSP project (see projects/DSP.md):
+# downsample, window, FFT, power spectrum, then find the peak and noise floor.
+#
+# Copy this file to your CIRCUITPY lib/ folder, then use it like this:
+#
+#   from e4s_capture import Capture
+#   from e4s_dsp import Pipeline
+#
+#   NAVG, NMEASURE = 8, 512
+#   capture = Capture(mic, NAVG * NMEASURE)
+#   dsp = Pipeline(NMEASURE, NAVG, f0=80000)
+#   while True:
+#       capture.read()
+#       dsp.set_rate(capture.rate)
+#       power = dsp.process(capture.values)
+#       freq, snr = dsp.peak()
+#       print(f'{freq:.0f} Hz, {snr:.0f} x noise')
+#
+# Everything that only depends on (NMEASURE, NAVG, f0) is calculated once when the Pipeline is
+# created: the window table, the frequency axis and the "twiddle" factors of the FFT. Each call to
+# process() then only uses vectorized array operations:
+#
+#  - the NSAMPLES = NMEASURE * NAVG samples are averaged in blocks of NAVG by reshaping them
+#    into a NMEASURE x NAVG array and taking the mean along its second axis,
+#  - the mean is subtracted and the window is applied,
+#  - since the input is real, its FFT is symmetric and only the NMEASURE/2 positive frequencies
+#    are needed. These are calculated with a complex FFT of half the size, using the even samples
+#    as the real part and the odd samples as the imaginary part, then separating the two,
+#  - power = (fft_real ** 2 + fft_imag ** 2) / NMEASURE as in the DSP project.
+#
+# The same code runs with ulab on the microcontroller or with numpy under regular python,
+# where it can be checked against numpy.fft.rfft and benchmarked, by passing xp=numpy.
+#
+# A Spectrogram tracks signals that change with time, such as the tunes played by play_notes()
+# in hello_speaker.py, using a short-time Fourier transform (STFT): a spectrum of the most recent
+# nframe measurements is calculated every hop new measurements, so consecutive frames overlap by
+# nframe - hop. Each spectrum is returned as a compact row of nframe/2 bytes, one per frequency,
+# with the power in decibels scaled from db_min (0) to db_max (255), ready to print, send over
+# USB or store. For example, with the Pico ADC streaming at 80 kHz (see e4s_capture.py) and
+# averaging 8 samples per measurement, there are 10000 measurements per second:
+#
+#   stream = Stream(analogbufio.BufferedIn(board.A0, sample_rate=80000), 1024, 80000)
+#   decimate = Pipeline(128, navg=8)
+#   spectrogram = Spectrogram(256, hop=64, f0=10000)
+#   while True:
+#       for row in spectrogram.push(decimate.downsample(stream.read())):
+#           ...use row...
+#
+# which produces 10000 / 64 = 156 rows per second with a 39 Hz frequency resolution.
+# The measurements are kept in a buffer of 2 * nframe values where each one is written twice,
+# nframe apart, so the most recent nframe values are always a contiguous slice of the buffer
+# that can be transformed without copying.
+
+import math
+import time
+
+try:
+    import ulab.numpy as xp_default
+except ImportError:
+    try:
+        import numpy as xp_default
+    except ImportError:
+        xp_default = None
+
+# The median of the power at frequencies with only noise is ln(2) times its mean.
+LN2 = math.log(2)
+
+
+def complex_fft(xp, real, imag):
+    # Return the (real, imag) parts of the FFT of real + i * imag with any backend.
+    if not hasattr(xp, 'ndinfo'):
+        # numpy
+        z = xp.fft.fft(real + 1j * imag)
+        return z.real, z.imag
+    try:
+        # ulab built without complex support takes and returns the real and imaginary parts.
+        return xp.fft.fft(real, imag)
+    except TypeError:
+        # ulab built with complex support takes and returns a single complex array.
+        z = xp.fft.fft(real + 1j * imag)
+        return xp.real(z), xp.imag(z)
+
+
+class Pipeline:
+
+    def __init__(self, nmeasure, navg=1, f0=1., window='hann', scale=1., xp=None):
+        # f0 is the sampling rate (of the samples before averaging) in Hz, and scale converts
+        # ADU to the units of the measurements, e.g. 3300 / 0xffff for mV.
+        if nmeasure < 4 or nmeasure & (nmeasure - 1):
+            raise ValueError('nmeasure must be a power of 2')
+        self.xp = xp = xp or xp_default
+        self.nmeasure = nmeasure
+        self.navg = navg
+        self.scale = scale
+        self.nfreq = nfreq = nmeasure // 2
+        # Window table, normalized so that the average noise power is unchanged.
+        if window == 'hann':
+            w = [0.5 - 0.5 * math.cos(2 * math.pi * i / nmeasure) for i in range(nmeasure)]
+        elif window is None:
+            w = [1.] * nmeasure
+        else:
+            raise ValueError(f'unknown window: {window}')
+        norm = scale / math.sqrt(sum(x * x for x in w) / nmeasure)
+        self.window = xp.array([x * norm for x in w])
+        # Twiddle factors exp(-2 pi i k / nmeasure) used to separate the even and odd samples.
+        self.cos = xp.array([math.cos(2 * math.pi * k / nmeasure) for k in range(nfreq)])
+        self.sin = xp.array([math.sin(2 * math.pi * k / nmeasure) for k in range(nfreq)])
+        self.k = xp.arange(nfreq)
+        self.set_rate(f0)
+        # Results of the most recent call to process().
+        self.measurements = None
+        self.fft_real = None
+        self.fft_imag = None
+        self.power = None
+
+    def set_rate(self, f0):
+        # Update the frequency axis for a new sampling rate in Hz.
+        self.f0 = f0
+        self.df = f0 / (self.nmeasure * self.navg)
+        self.freqs = self.k * self.df
+
+    def downsample(self, samples):
+        # Average consecutive blocks of navg samples.
+        xp = self.xp
+        if self.navg == 1:
+            return samples * 1.
+        return xp.mean(samples.reshape((self.nmeasure, self.navg)), axis=1)
+
+    def rfft(self, x):
+        # Return the (real, imag) FFT of the real array x at the nfreq non-negative frequencies
+        # below the Nyquist frequency, using one complex FFT of size nmeasure / 2.
+        xp = self.xp
+        zr, zi = complex_fft(xp, x[0::2], x[1::2])
+        # Z[(M - k) % M] for k = 0..M-1
+        zr_rev = xp.concatenate((zr[0:1], zr[:0:-1]))
+        zi_rev = xp.concatenate((zi[0:1], zi[:0:-1]))
+        # FFT of the even samples, E, and of the odd samples, O.
+        er = 0.5 * (zr + zr_rev)
+        ei = 0.5 * (zi - zi_rev)
+        odd_r = 0.5 * (zi + zi_rev)
+        odd_i = 0.5 * (zr_rev - zr)
+        # X[k] = E[k] + exp(-2 pi i k / N) O[k]
+        c, s = self.cos, self.sin
+        return er + c * odd_r + s * odd_i, ei + c * odd_i - s * odd_r
+
+    def process(self, samples):
+        # Run the whole chain on nmeasure * navg raw samples and return the power spectrum.
+        m = self.downsample(samples)
+        m = (m - self.xp.mean(m)) * self.window
+        self.measurements = m
+        self.fft_real, self.fft_imag = self.rfft(m)
+        self.power = (self.fft_real ** 2 + self.fft_imag ** 2) / self.nmeasure
+        return self.power
+
+    def noise_floor(self):
+        # Average noise power per frequency, estimated from the median so that
+        # a few strong peaks do not bias it (unlike the mean used in the DSP project).
+        return self.xp.median(self.power[1:]) / LN2
+
+    def peak(self):
+        # Return the frequency in Hz of the largest power, ignoring the DC component,
+        # and its ratio to the noise floor.
+        xp = self.xp
+        i = int(xp.argmax(self.power[1:])) + 1
+        noise = self.noise_floor()
+        return i * self.df, (self.power[i] / noise if noise > 0 else math.inf)
+
+
+class Spectrogram:
+
+    def __init__(self, nframe, hop, f0=1., window='hann', db_min=-20., db_max=80., xp=None):
+        # f0 is the rate of the measurements passed to push() in Hz.
+        if not 0 < hop <= nframe:
+            raise ValueError('hop must be between 1 and nframe')
+        self.pipeline = Pipeline(nframe, 1, f0, window, xp=xp)
+        self.xp = xp = self.pipeline.xp
+        self.nframe = nframe
+        self.hop = hop
+        self.freqs = self.pipeline.freqs
+        self.db_min = db_min
+        self.db_max = db_max
+        self.db_scale = 255 / (db_max - db_min)
+        # Each measurement is stored at i and i + nframe.
+        self.buffer = xp.zeros(2 * nframe)
+        self.pos = 0
+        # Number of measurements still needed before the next row.
+        self.needed = nframe
+        self.nrows = 0
+        # Time spent calculating the most recent row in nanoseconds.
+        self.row_ns = 0
+
+    def push(self, measurements):
+        # Add new measurements and yield a row for each hop completed.
+        buffer = self.buffer
+        nframe = self.nframe
+        n = len(measurements)
+        i = 0
+        while i < n:
+            # Copy as many values as possible without wrapping around the end of the buffer.
+            take = min(n - i, self.needed, nframe - self.pos)
+            chunk = measurements[i:i + take]
+            pos = self.pos
+            buffer[pos:pos + take] = chunk
+            buffer[pos + nframe:pos + nframe + take] = chunk
+            self.pos = (pos + take) % nframe
+            self.needed -= take
+            i += take
+            if self.needed == 0:
+                self.needed = self.hop
+                # The oldest measurement is at self.pos.
+                yield self.row(buffer[self.pos:self.pos + nframe])
+
+    def row(self, frame):
+        # Return the quantized dB power spectrum of one frame of nframe measurements.
+        start = time.monotonic_ns()
+        xp = self.xp
+        pipeline = self.pipeline
+        fft_real, fft_imag = pipeline.rfft((frame - xp.mean(frame)) * pipeline.window)
+        power = (fft_real ** 2 + fft_imag ** 2) / self.nframe
+        # Add a tiny power to avoid log(0).
+        db = 10 * xp.log10(power + 1e-12)
+        q = xp.clip((db - self.db_min) * self.db_scale, 0, 255)
+        out = xp.array(q, dtype=xp.uint8).tobytes()
+        self.nrows += 1
+        self.row_ns = time.monotonic_ns() - start
+        return out
+
+    def decode(self, row):
+        # Convert a row of bytes back to a list of powers in dB.
+        return [self.db_min + q / self.db_scale for q in row]
+
+
+def benchmark(pipeline, nrep=20):
+    # Return the average time in ms of pipeline.process() on random samples.
+    import random
+    xp = pipeline.xp
+    samples = xp.array([random.randint(0, 0xffff) for i in range(pipeline.nmeasure * pipeline.navg)],
+                       dtype=xp.uint16)
+    start = time.monotonic_ns()
+    for i in range(nrep):
+        pipeline.process(samples)
+    return 1e-6 * (time.monotonic_ns() - start) / nrep
+
+
+if __name__ == '__main__':
+    for nmeasure in (256, 512, 1024):
+        pipeline = Pipeline(nmeasure, navg=8, f0=80000)
+        print(f'NMEASURE={nmeasure} NAVG=8: {benchmark(pipeline):.2f} ms')
+    # Real-time check of the example above: 10000 measurements per second.
+    spectrogram = Spectrogram(256, hop=64, f0=10000)
+    decimate = Pipeline(128, navg=8)
+    block = decimate.downsample(spectrogram.xp.zeros(1024))
+    start = time.monotonic_ns()
+    for i in range(50):
+        for row in spectrogram.push(block):
+            pass
+    elapsed = 1e-9 * (time.monotonic_ns() - start)
+    print(f'Spectrogram: {spectrogram.nrows / elapsed:.0f} rows/s, 156 rows/s needed')
@@ -0,0 +1,137 @@
+# UCI Electronics for Scientists
+# https://github.com/dkirkby/E4S
+#
+# Detect a few known tones, such as the notes played by hello_speaker.py or the carrier of
+# the Chatter project, without calculating a full FFT.
+#
+# Copy this file to your CIRCUITPY lib/ folder, then use it like this:
+#
+#   from e4s_capture import Capture
+#   from e4s_goertzel import GoertzelBank
+#
+#   capture = Capture(mic, 512)
+#   capture.read()
+#   bank = GoertzelBank([440, 880, 1760], f0=capture.rate, offset=np.mean(capture.values))
+#   while True:
+#       capture.read()
+#       bank.reset()
+#       bank.update(capture.values)
+#       print(bank.power())
+#
+# where capture.values is the ulab (or numpy) view of the samples filled in by capture.read().
+# An FFT calculates the power at all NSAMPLES/2 frequencies, but we often only care about a
+# handful of them. The Goertzel algorithm calculates the DFT term at a single frequency f with
+# the recurrence s[n] = x[n] + 2 cos(w) s[n-1] - s[n-2], where w = 2 pi f / f0, so K tones cost
+# about K * NSAMPLES multiply-adds instead of the FFT's NSAMPLES * log2(NSAMPLES). The frequency
+# does not need to be a multiple of f0 / NSAMPLES, unlike the FFT bins.
+#
+# The bank runs the recurrence for all its tones at once, so its state is just s[n-1] and s[n-2]
+# for each tone, and samples can be fed in blocks of any size as they are captured: feeding them
+# in several blocks gives exactly the same power as feeding them all at once. The ADC readings of
+# a microphone are centered on a constant level (about 32768), which would leak into every tone,
+# so offset is subtracted from each sample. Measure it once, e.g. with the mean of a first
+# capture as above, rather than subtracting the mean of each block, which would depend on how
+# the samples are split into blocks.
+#
+# Each sample costs one iteration of a python loop with a few array operations on K values, which
+# needs very little memory but is not always faster than the compiled ulab FFT of a whole block.
+# Run this file on your board to compare both for a few numbers of tones.
+#
+# The same code runs with ulab on the microcontroller or with numpy under regular python.
+
+import math
+import time
+
+try:
+    import ulab.numpy as xp_default
+except ImportError:
+    try:
+        import numpy as xp_default
+    except ImportError:
+        xp_default = None
+
+
+def goertzel_power(samples, freq, f0):
+    # Reference implementation of the Goertzel recurrence for a single tone, in plain python.
+    # Returns the same power as GoertzelBank.power().
+    w = 2 * math.pi * freq / f0
+    coeff = 2 * math.cos(w)
+    s1 = s2 = 0.
+    for x in samples:
+        s1, s2 = x + coeff * s1 - s2, s1
+    # |X|^2 with X = exp(i w (N - 1)) (s1 - exp(-i w) s2), which has the same magnitude.
+    return (s1 * s1 + s2 * s2 - coeff * s1 * s2) / len(samples)
+
+
+class GoertzelBank:
+
+    def __init__(self, freqs, f0, offset=0., xp=None):
+        # freqs are the tone frequencies and f0 the sampling rate in Hz.
+        # offset is subtracted from every sample passed to update().
+        self.xp = xp = xp or xp_default
+        self.freqs = list(freqs)
+        self.f0 = f0
+        self.offset = float(offset)
+        # 2 cos(w) of each tone.
+        self.coeff = xp.array([2 * math.cos(2 * math.pi * f / f0) for f in self.freqs])
+        self.reset()
+
+    def reset(self):
+        xp = self.xp
+        ntones = len(self.freqs)
+        # s[n-1] and s[n-2] of each tone.
+        self.s1 = xp.zeros(ntones)
+        self.s2 = xp.zeros(ntones)
+        self.nsamples = 0
+
+    def update(self, samples):
+        # Add a block of samples of any size, e.g. the values of a Capture or Stream.
+        coeff, s1, s2 = self.coeff, self.s1, self.s2
+        offset = self.offset
+        for x in samples:
+            s1, s2 = coeff * s1 - s2 + (x - offset), s1
+        self.s1, self.s2 = s1, s2
+        self.nsamples += len(samples)
+
+    def power(self):
+        # Power of each tone with the normalization of the DSP project: |X|^2 / NSAMPLES.
+        if self.nsamples == 0:
+            return self.xp.zeros(len(self.freqs))
+        s1, s2 = self.s1, self.s2
+        return (s1 * s1 + s2 * s2 - self.coeff * s1 * s2) / self.nsamples
+
+    def strongest(self):
+        # Return the frequency of the tone with the largest power and its power.
+        power = self.power()
+        i = int(self.xp.argmax(power))
+        return self.freqs[i], power[i]
+
+
+def benchmark(freqs, f0=10000, nsamples=512, nrep=20, xp=None):
+    # Return the average times in ms of the FFT path of the DSP project (without downsampling)
+    # and of a GoertzelBank, on the same random samples.
+    import random
+    from e4s_dsp import Pipeline
+    xp = xp or xp_default
+    samples = xp.array([random.randint(0, 0xffff) for i in range(nsamples)], dtype=xp.uint16)
+    pipeline = Pipeline(nsamples, f0=f0, window=None, xp=xp)
+    start = time.monotonic_ns()
+    for i in range(nrep):
+        pipeline.process(samples)
+    fft_ms = 1e-6 * (time.monotonic_ns() - start) / nrep
+    bank = GoertzelBank(freqs, f0, offset=0x8000, xp=xp)
+    start = time.monotonic_ns()
+    for i in range(nrep):
+        bank.reset()
+        bank.update(samples)
+        bank.power()
+    bank_ms = 1e-6 * (time.monotonic_ns() - start) / nrep
+    return fft_ms, bank_ms
+
+
+if __name__ == '__main__':
+    # The 12 notes of the first octave of hello_speaker.py.
+    notes = [440 * math.pow(2, i / 12) for i in range(12)]
+    for ntones in (1, 3, 12):
+        fft_ms, bank_ms = benchmark(notes[:ntones])
+        print(f'{ntones:2d} tones: FFT {fft_ms:.2f} ms, Goertzel {bank_ms:.2f} ms')
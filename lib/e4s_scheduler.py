@@ -0,0 +1,225 @@
+# UCI Electronics for Scientists
+# https://github.com/dkirkby/E4S
+#
+# Run several periodic sensor tasks concurrently with asyncio and monitor their timing.
+#
+# Copy this file to your CIRCUITPY lib/ folder, together with the asyncio/ folder and
+# adafruit_ticks.mpy from the CircuitPython library bundle, then use it like this:
+#
+#   from e4s_scheduler import Scheduler
+#
+#   scheduler = Scheduler()
+#   scheduler.add('imu', read_imu, period=0.02)
+#   scheduler.add('pressure', read_pressure, period=0.2, deadline=0.05)
+#   scheduler.add('oled', update_display, period=1.)
+#   scheduler.add('report', scheduler.report, period=10.)
+#   scheduler.run()
+#
+# Combining the loops of several hello scripts into one "while True: ...; time.sleep(n)" loop
+# reads every sensor at the rate of the slowest, and delays each reading by the latencies of all
+# the others. Instead, each task here is an asyncio task that calls its function once per period
+# seconds, at fixed release times that do not drift, while the other tasks run in between.
+#
+# A function can be a regular function, which runs to completion before any other task, or an
+# async function, which lets other tasks run whenever it awaits, e.g. during an integration time:
+#
+#   async def read_multispec():
+#       multispec.start_measurement()
+#       await asyncio.sleep(0.1)
+#       return multispec.read_measurement()
+#
+# For each task, the scheduler records:
+#  - jitter: the delay between each release time and the actual start, which is caused by the
+#    other tasks (this is how late the sensor is read);
+#  - overruns: the number of calls that finished more than deadline seconds (by default one
+#    period) after their release time, and the number of release times that were skipped
+#    because the previous call finished too late;
+#  - CPU share: the fraction of the time spent running the function. For an async function, only
+#    the time between each resumption and its next await counts, not the time it spends waiting.
+#
+# The rest of the time, shown as idle by report(), is either idle or spent in the asyncio loop.
+#
+# Timing uses time.monotonic_ns(), so this module also runs under regular python, where
+# FakeSensor stands in for the I2C drivers. bin/check-scheduler.py uses them to check the
+# statistics recorded for a few combinations of tasks.
+
+import time
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+
+class Timed:
+    # Await a coroutine one step at a time, adding the time of each step to task.busy_ns.
+
+    def __init__(self, coro, task):
+        self.coro = coro
+        self.task = task
+
+    def __iter__(self):
+        coro, task = self.coro, self.task
+        send, value = coro.send, None
+        while True:
+            start = time.monotonic_ns()
+            try:
+                awaited = send(value)
+            except StopIteration as e:
+                task.busy_ns += time.monotonic_ns() - start
+                return e.value
+            task.busy_ns += time.monotonic_ns() - start
+            try:
+                value = yield awaited
+                send = coro.send
+            except BaseException as e:
+                # Pass exceptions, e.g. when the task is cancelled, on to the coroutine.
+                send, value = coro.throw, e
+
+    __await__ = __iter__
+
+
+class Task:
+
+    def __init__(self, name, func, period, deadline=None, offset=0.):
+        self.name = name
+        self.func = func
+        self.period_ns = int(1e9 * period)
+        self.deadline_ns = int(1e9 * (deadline if deadline is not None else period))
+        self.offset_ns = int(1e9 * offset)
+        # Most recent value returned by func.
+        self.value = None
+        self.reset()
+
+    def reset(self):
+        self.ncalls = 0
+        self.noverruns = 0
+        self.nskipped = 0
+        self.busy_ns = 0
+        self.jitter_sum_ns = 0
+        self.jitter_max_ns = 0
+
+    async def call(self):
+        start = time.monotonic_ns()
+        result = self.func()
+        self.busy_ns += time.monotonic_ns() - start
+        # Calling an async function returns a coroutine, which must be awaited.
+        if hasattr(result, 'send'):
+            result = await Timed(result, self)
+        self.value = result
+
+    async def run(self, start_ns):
+        release = start_ns + self.offset_ns
+        while True:
+            delay = release - time.monotonic_ns()
+            if delay > 0:
+                await asyncio.sleep(delay * 1e-9)
+            begin = time.monotonic_ns()
+            await self.call()
+            end = time.monotonic_ns()
+            jitter = begin - release
+            self.ncalls += 1
+            self.jitter_sum_ns += jitter
+            if jitter > self.jitter_max_ns:
+                self.jitter_max_ns = jitter
+            if end - release > self.deadline_ns:
+                self.noverruns += 1
+            release += self.period_ns
+            if end > release:
+                # Skip the missed release times rather than calling back to back to catch up.
+                nskip = (end - release) // self.period_ns + 1
+                self.nskipped += nskip
+                release += nskip * self.period_ns
+
+
+class Scheduler:
+
+    def __init__(self):
+        self.tasks = []
+        self.start_ns = None
+
+    def add(self, name, func, period, deadline=None, offset=0.):
+        # Call func() every period seconds, starting offset seconds after the scheduler starts.
+        # Calls that finish more than deadline seconds after their release time are overruns.
+        if period <= 0:
+            raise ValueError('period must be positive')
+        task = Task(name, func, period, deadline, offset)
+        self.tasks.append(task)
+        return task
+
+    def reset(self):
+        # Restart the statistics of all tasks.
+        self.start_ns = time.monotonic_ns()
+        for task in self.tasks:
+            task.reset()
+
+    def stats(self):
+        # Return {name: (ncalls, mean jitter ms, max jitter ms, noverruns, nskipped, CPU share)}.
+        elapsed = max(1, time.monotonic_ns() - self.start_ns)
+        stats = {}
+        for task in self.tasks:
+            n = max(1, task.ncalls)
+            stats[task.name] = (
+                task.ncalls, 1e-6 * task.jitter_sum_ns / n, 1e-6 * task.jitter_max_ns,
+                task.noverruns, task.nskipped, task.busy_ns / elapsed)
+        return stats
+
+    def report(self):
+        # Print the statistics of each task, e.g. from a task of its own.
+        print('task          calls  jitter ms (mean max)  overruns  skipped   CPU')
+        total = 0.
+        for name, (ncalls, mean, worst, noverruns, nskipped, share) in self.stats().items():
+            total += share
+            print(f'{name:12s} {ncalls:6d} {mean:10.2f} {worst:9.2f} {noverruns:9d} {nskipped:8d} {100 * share:5.1f}%')
+        print(f'{"idle":12s} {"":48s}{100 * max(0., 1 - total):5.1f}%')
+
+    async def main(self, duration=None):
+        self.reset()
+        running = [asyncio.create_task(task.run(self.start_ns)) for task in self.tasks]
+        if duration is None:
+            await asyncio.gather(*running)
+        else:
+            await asyncio.sleep(duration)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    def run(self, duration=None):
+        # Run all tasks forever, or for duration seconds.
+        asyncio.run(self.main(duration))
+
+
+class FakeSensor:
+
+    def __init__(self, latency, value=0.):
+        # Each read blocks for latency seconds, like an I2C transfer, then returns value.
+        self.latency = latency
+        self.value = value
+        self.nreads = 0
+
+    def read(self):
+        time.sleep(self.latency)
+        self.nreads += 1
+        return self.value
+
+
+if __name__ == '__main__':
+    # Fake versions of the sensors of hello_imu.py, hello_pressure.py, hello_multispec.py and
+    # hello_oled.py, with typical I2C latencies.
+    imu = FakeSensor(0.002, (0., 0., 9.81))
+    dps310 = FakeSensor(0.005, 1013.25)
+    as7341 = FakeSensor(0.001, [100] * 10)
+    oled = FakeSensor(0.030)
+
+    async def read_multispec():
+        # Let the other tasks run during the 50ms integration time.
+        await asyncio.sleep(0.05)
+        return as7341.read()
+
+    scheduler = Scheduler()
+    scheduler.add('imu', imu.read, period=0.01, deadline=0.005)
+    scheduler.add('pressure', dps310.read, period=0.1, deadline=0.02, offset=0.003)
+    scheduler.add('multispec', read_multispec, period=0.2, deadline=0.1)
+    scheduler.add('oled', oled.read, period=0.5, offset=0.005)
+    scheduler.run(duration=3)
+    scheduler.report()
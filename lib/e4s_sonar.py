@@ -0,0 +1,253 @@
+# UCI Electronics for Scientists
+# https://github.com/dkirkby/E4S
+#
+# Read the HC-SR04 ultrasonic distance sensor in the background with asyncio.
+#
+# Copy this file to your CIRCUITPY lib/ folder, together with the asyncio/ folder and
+# adafruit_ticks.mpy from the CircuitPython library bundle (which are not in the E4S library zips),
+# then use it like this:
+#
+#   import asyncio
+#   from e4s_sonar import Sonar
+#
+#   sonar = Sonar(board.GP21, board.GP22)
+#
+#   async def report():
+#       while True:
+#           print((sonar.distance,))
+#           await asyncio.sleep(0.1)
+#
+#   async def main():
+#       await asyncio.gather(sonar.run(), report())
+#
+#   asyncio.run(main())
+#
+# Without asyncio, call update() in your own loop instead, which waits for each echo:
+#
+#   while True:
+#       sonar.update()
+#       print((sonar.distance,))
+#       time.sleep(0.1)
+#
+# Each read of adafruit_hcsr04.HCSR04.distance blocks the whole program until the echo returns,
+# or until it times out and raises a RuntimeError. A Sonar instead triggers a ping every period
+# seconds (at least 60ms, so that the echoes of one ping have died out before the next) and the
+# echo pulse is timed by the pulseio hardware, while run() lets other tasks run until the pulse
+# has arrived or the ping has timed out.
+#
+# The distances of the last nkeep pings are kept in a ring buffer. The filtered distance is the
+# mean of the recent distances within nsigma robust standard deviations of their median, where
+# the robust standard deviation is 1.4826 times the median absolute deviation (MAD), so that
+# occasional bad echoes are ignored. The fraction of the recent pings that timed out, and the
+# time between each trigger and the end of its echo (the ping latency), are also available.
+#
+# The trigger and echo can be any objects with the same interface as digitalio.DigitalInOut and
+# pulseio.PulseIn, so this module also runs under regular python with FakeEcho for testing.
+
+import time
+import array
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+# Speed of sound in cm per microsecond, halved for the round trip.
+CM_PER_US = 0.0343 / 2
+MIN_PERIOD = 0.06
+# Pulses this long or longer mean that the sensor timed out.
+MAX_PULSE_US = 65535
+
+
+def median(values):
+    values = sorted(values)
+    n = len(values)
+    return values[n // 2] if n % 2 else 0.5 * (values[n // 2 - 1] + values[n // 2])
+
+
+class Sonar:
+
+    def __init__(self, trigger_pin, echo_pin, period=0.1, nkeep=9, nsigma=3., timeout=0.1,
+                 trigger=None, echo=None):
+        # Pass trigger and echo instead of pins to use other (e.g. fake) objects.
+        if period < MIN_PERIOD:
+            raise ValueError(f'period must be at least {MIN_PERIOD}s')
+        if trigger is None:
+            import digitalio
+            trigger = digitalio.DigitalInOut(trigger_pin)
+            trigger.direction = digitalio.Direction.OUTPUT
+        if echo is None:
+            import pulseio
+            echo = pulseio.PulseIn(echo_pin)
+        trigger.value = False
+        echo.pause()
+        echo.clear()
+        self.trigger = trigger
+        self.echo = echo
+        self.period = period
+        self.nsigma = nsigma
+        self.timeout_ns = int(1e9 * timeout)
+        # Ring buffers of the most recent pings.
+        self.nkeep = nkeep
+        self.distances = array.array('f', [0.] * nkeep)
+        self.timed_out = bytearray(nkeep)
+        self.nvalid = 0
+        self.index = 0
+        # Statistics of all pings so far.
+        self.npings = 0
+        self.ntimeouts = 0
+        self.latency_ns = 0
+        self.pending = False
+        # Most recent filtered distance in cm, or None.
+        self.distance = None
+
+    def trigger_ping(self):
+        # Start a ping with a 10us trigger pulse.
+        echo = self.echo
+        echo.clear()
+        self.trigger.value = True
+        time.sleep(0.00001)
+        self.trigger.value = False
+        echo.resume()
+
+    def finish_ping(self, start):
+        # Return the distance in cm of the ping started at start, or None if it timed out.
+        # Also returns None while the echo has not arrived yet and the ping has not timed out.
+        echo = self.echo
+        if not len(echo):
+            if time.monotonic_ns() - start > self.timeout_ns:
+                echo.pause()
+                self.pending = False
+            return None
+        echo.pause()
+        self.pending = False
+        self.latency_ns = time.monotonic_ns() - start
+        pulse_us = echo[0]
+        if pulse_us >= MAX_PULSE_US:
+            return None
+        return pulse_us * CM_PER_US
+
+    async def ping(self):
+        # Return the distance in cm of one ping, or None if it timed out, letting other tasks run.
+        start = time.monotonic_ns()
+        self.trigger_ping()
+        self.pending = True
+        while True:
+            distance = self.finish_ping(start)
+            if not self.pending:
+                return distance
+            await asyncio.sleep(0)
+
+    def update(self):
+        # Ping once, waiting for the echo, and update the filtered distance without asyncio.
+        start = time.monotonic_ns()
+        self.trigger_ping()
+        self.pending = True
+        while self.pending:
+            distance = self.finish_ping(start)
+        self.add(distance)
+
+    def add(self, distance):
+        # Add the result of one ping to the ring buffers and update the filtered distance.
+        i = self.index
+        self.index = (i + 1) % self.nkeep
+        self.npings += 1
+        if distance is None:
+            self.ntimeouts += 1
+            self.timed_out[i] = 1
+        else:
+            self.timed_out[i] = 0
+            self.distances[i] = distance
+        recent = [self.distances[j] for j in range(min(self.npings, self.nkeep)) if not self.timed_out[j]]
+        self.nvalid = len(recent)
+        if not recent:
+            self.distance = None
+            return
+        mid = median(recent)
+        cut = self.nsigma * 1.4826 * median([abs(d - mid) for d in recent])
+        good = [d for d in recent if abs(d - mid) <= cut]
+        self.distance = sum(good) / len(good)
+
+    @property
+    def timeout_rate(self):
+        # Fraction of the recent pings that timed out.
+        n = min(self.npings, self.nkeep)
+        return sum(self.timed_out[:n]) / n if n else 0.
+
+    async def run(self):
+        # Ping every period seconds forever.
+        period_ns = int(1e9 * self.period)
+        next_ns = time.monotonic_ns()
+        while True:
+            self.add(await self.ping())
+            next_ns += period_ns
+            delay = next_ns - time.monotonic_ns()
+            if delay < 0:
+                # Skip the missed pings rather than pinging too fast to catch up.
+                next_ns = time.monotonic_ns()
+                delay = 0
+            await asyncio.sleep(delay * 1e-9)
+
+
+class FakeEcho:
+
+    def __init__(self, distance):
+        # distance() returns the distance in cm of the next echo, or None for a timeout.
+        self.distance = distance
+        self.pulses = []
+        self.ready_ns = 0
+
+    def pause(self):
+        pass
+
+    def clear(self):
+        self.pulses = []
+
+    def resume(self):
+        # The echo pulse ends after the sound has made the round trip.
+        distance = self.distance()
+        pulse_us = MAX_PULSE_US if distance is None else int(distance / CM_PER_US)
+        self.ready_ns = time.monotonic_ns() + 1000 * min(pulse_us, 40000)
+        self.pulse_us = pulse_us
+
+    def __len__(self):
+        if not self.pulses and self.ready_ns and time.monotonic_ns() >= self.ready_ns:
+            self.pulses = [self.pulse_us]
+        return len(self.pulses)
+
+    def __getitem__(self, i):
+        return self.pulses[i]
+
+
+class FakeTrigger:
+    value = False
+
+
+if __name__ == '__main__':
+    import random
+
+    def distance():
+        # 50cm with 1cm noise, 10% bad echoes and 10% timeouts.
+        r = random.random()
+        if r < 0.1:
+            return None
+        if r < 0.2:
+            return random.uniform(2, 400)
+        return random.gauss(50, 1)
+
+    sonar = Sonar(None, None, trigger=FakeTrigger(), echo=FakeEcho(distance))
+
+    async def report():
+        for i in range(10):
+            await asyncio.sleep(0.5)
+            # The distance is None whenever all recent pings timed out.
+            distance = 'no echo' if sonar.distance is None else f'{sonar.distance:.1f}cm'
+            print(f'{distance} from {sonar.nvalid} pings, timeout rate {sonar.timeout_rate:.2f}, '
+                  f'latency {1e-6 * sonar.latency_ns:.1f}ms, {sonar.npings} pings')
+
+    async def main():
+        task = asyncio.create_task(sonar.run())
+        await report()
+        task.cancel()
+
+    asyncio.run(main())
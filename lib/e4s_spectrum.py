@@ -0,0 +1,58 @@
+# UCI Electronics for Scientists
+# https://github.com/dkirkby/E4S
+#
+# Reconstruct a spectrum from the 10 channels of the AS7341 multispectral sensor with an
+# operator precomputed on a computer by projects/Multispec/calibration.py:
+#
+#   python calibration.py --regularize 0.01 --output spectrum.bin
+#
+# Copy this file to your CIRCUITPY lib/ folder and spectrum.bin to your CIRCUITPY drive,
+# then use it like this (see projects/Multispec/linearspec.py):
+#
+#   from e4s_spectrum import load_operator
+#
+#   wlen, operator = load_operator('spectrum.bin')
+#   flux = np.dot(operator, channels)
+#
+# where channels are the fluxes of the 8 bands, clear and nir, in that order, and flux is the
+# spectrum at each wavelength in wlen (in nm).
+#
+# Solving the regularized least-squares problem involves inverting a matrix, which is done once
+# on the computer, so the board only needs a single small matrix-vector multiply per spectrum.
+# The operator file is a small header followed by float32 tables, all little endian:
+#
+#   magic     4 bytes  b'E4OP'
+#   nwlen     2 bytes  number of wavelengths
+#   nchannel  2 bytes  number of channels (10)
+#   wlen      nwlen float32 values
+#   operator  nwlen x nchannel float32 values, row by row
+
+import array
+import struct
+
+try:
+    import ulab.numpy as np
+except ImportError:
+    import numpy as np
+
+MAGIC = b'E4OP'
+
+
+def read_floats(f, n):
+    # Read n float32 values directly into a preallocated array.
+    values = array.array('f', bytes(4 * n))
+    if f.readinto(values) != 4 * n:
+        raise ValueError('operator file is truncated')
+    return values
+
+
+def load_operator(path):
+    # Return the (wlen, operator) arrays saved by calibration.py.
+    with open(path, 'rb') as f:
+        magic, nwlen, nchannel = struct.unpack('<4sHH', f.read(8))
+        if magic != MAGIC:
+            raise ValueError(f'not an operator file: {path}')
+        wlen = read_floats(f, nwlen)
+        operator = read_floats(f, nwlen * nchannel)
+    # Convert to the float type of ulab, which is float32 or float64 depending on the board.
+    return np.array(wlen), np.array(operator).reshape((nwlen, nchannel))
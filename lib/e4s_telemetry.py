@@ -0,0 +1,119 @@
+# UCI Electronics for Scientists
+# https://github.com/dkirkby/E4S
+#
+# Send arrays of measurements to a computer as compact binary frames over USB.
+#
+# Copy this file to your CIRCUITPY lib/ folder, then use it like this:
+#
+#   from e4s_telemetry import Telemetry
+#
+#   telemetry = Telemetry()
+#   while True:
+#       samples = capture.read()
+#       telemetry.send(samples)
+#
+# and read the frames on the computer with bin/read-telemetry.py (see its docstring).
+#
+# Printing one (value,) tuple per sample for the Mu plotter formats every number as text, which
+# is much slower than sampling it, and the text is several times larger than the 2 bytes of each
+# ADC sample. A Telemetry instead writes each array as one frame on the second USB serial port,
+# usb_cdc.data, which is separate from the console used by print(). The data port is only
+# available after adding these lines to your CIRCUITPY boot.py and resetting the board:
+#
+#   import usb_cdc
+#   usb_cdc.enable(console=True, data=True)
+#
+# If the data port is not enabled, or if you pass text=True, send() prints the same values as
+# tuples instead, one line per sample, so the Mu plotter still works.
+#
+# Each frame is a 9-byte header, the raw bytes of the array, and a 4-byte CRC32 checksum of
+# the header and data, all little endian:
+#
+#   magic    2 bytes  b'E4'
+#   channel  1 byte   0-255, e.g. the position of the array in send(times, values)
+#   typecode 1 byte   array typecode of the values: 'b', 'B', 'h', 'H', 'l', 'L', 'f' or 'd'
+#   itemsize 1 byte   size of each value in bytes
+#   seq      2 bytes  frame counter, so that missing frames can be detected
+#   nbytes   2 bytes  size of the data that follows
+#
+# The item size is sent because the size of some typecodes depends on the platform, e.g. 'l' is
+# 4 bytes on the board but 8 bytes under regular python on most 64-bit computers.
+#
+# The same code runs under regular python, writing to any binary file or pipe.
+
+import struct
+import binascii
+
+try:
+    import usb_cdc
+except ImportError:
+    usb_cdc = None
+
+MAGIC = b'E4'
+HEADER = '<2sBBBHH'
+HEADER_SIZE = struct.calcsize(HEADER)
+MAX_NBYTES = 0xffff
+
+
+def typecode(data):
+    # Return the array typecode of an array.array, ulab or numpy array, or bytes.
+    code = getattr(data, 'typecode', None)
+    if code is not None:
+        return code
+    dtype = getattr(data, 'dtype', None)
+    if dtype is None:
+        return 'B'
+    if isinstance(dtype, int):
+        # ulab dtypes are the ord() of their typecode.
+        return chr(dtype)
+    # numpy
+    return {4: 'f', 8: 'd'}[dtype.itemsize] if dtype.kind == 'f' else dtype.char
+
+
+def itemsize(data, code):
+    # Return the size in bytes of each value of an array, or 1 for bytes.
+    size = getattr(data, 'itemsize', None)
+    return size if size is not None else struct.calcsize(code)
+
+
+class Telemetry:
+
+    def __init__(self, port=None, text=False):
+        # port is any object with a write(bytes) method, by default usb_cdc.data.
+        if port is None and usb_cdc is not None:
+            port = usb_cdc.data
+        self.port = port
+        self.text = text or port is None
+        self.header = bytearray(HEADER_SIZE)
+        self.trailer = bytearray(4)
+        self.seq = 0
+        self.nframes = 0
+        self.nbytes = 0
+
+    def write_frame(self, data, channel=0):
+        # Write one array (or bytes) as a single frame.
+        code = typecode(data)
+        size = itemsize(data, code)
+        nbytes = len(data) * size
+        if nbytes > MAX_NBYTES:
+            raise ValueError(f'frame too large: {nbytes} bytes')
+        header = self.header
+        struct.pack_into(HEADER, header, 0, MAGIC, channel, ord(code), size, self.seq, nbytes)
+        crc = binascii.crc32(data, binascii.crc32(header)) & 0xffffffff
+        struct.pack_into('<L', self.trailer, 0, crc)
+        port = self.port
+        port.write(header)
+        port.write(data)
+        port.write(self.trailer)
+        self.seq = (self.seq + 1) & 0xffff
+        self.nframes += 1
+        self.nbytes += HEADER_SIZE + nbytes + 4
+
+    def send(self, *columns):
+        # Send each array as a frame on channel 0, 1, ... or print them as rows of tuples.
+        if self.text:
+            for row in zip(*columns):
+                print(row)
+            return
+        for channel, data in enumerate(columns):
+            self.write_frame(data, channel)
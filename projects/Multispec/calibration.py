@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+'''
+Calculate the calibration matrix of the AS7341 multispectral sensor used by linearspec.py,
+as derived in Multispec.ipynb, and print it in the format to paste into linearspec.py:
+
+    cd projects/Multispec
+    python calibration.py [--gains 256*8,512,64] [--nodes 420:680:8]
+
+The notebook models the spectrum as piece-wise linear between a grid of node wavelengths, so
+the predicted flux in each band is a linear function of the fluxes at the nodes. It calculates
+the matrix of this function by finite differences, calling get_linear_pred() twice per node,
+which interpolates every filter curve again each time. Since the model is linear, the matrix is
+calculated here in one pass instead:
+
+    matrix[i, j] = integral of filter_i(wlen) * basis_j(wlen) dwlen
+
+where filter_i is the response curve of band i divided by its gain relative to 256 and basis_j
+is the piece-wise linear "hat" function of node j (extrapolated linearly beyond the first and last
+nodes, like scipy.interpolate.interp1d(..., fill_value='extrapolate') in the notebook). Both
+are tabulated on the notebook's fine wavelength grid, so the integral of all pairs is a single
+matrix product with the trapezoid rule weights.
+
+The bands are the first len(nodes) filter curves, as in the notebook, and any gains and node
+grid can be used, as long as the matrix can be inverted: a grid with more nodes than filter curves,
+or with nodes where the bands have no response (e.g. the 10th band, NIR, over 390-750nm), gives an
+error suggesting --regularize instead. The curves are loaded with curves.py. With --cache-dir DIR, the parsed curves,
+the matrix and its inverse are saved in DIR, keyed by the contents of the curves file and all the
+parameters, and reused by later runs. The same cache is
+kept in memory when this module is imported, e.g. from the notebook:
+
+    import calibration
+    inverse = calibration.get_inverse(gains=[256] * 8 + [512, 64])
+    print(calibration.ulab_literal(inverse))
+
+The exact inverse amplifies noise (see its alternating signs) and ignores the Clear and NIR
+channels. With --regularize LAMBDA, an operator that uses all 10 channels is calculated instead,
+on a finer grid of nodes, by least squares with a penalty LAMBDA on the second differences of the
+node fluxes (larger values give smoother spectra), and saved as float32 tables to --output:
+
+    python calibration.py --regularize 0.01 --output spectrum.bin
+
+Copy this file to your CIRCUITPY drive, and linearspec.py will use it, with lib/e4s_spectrum.py,
+so that each spectrum costs a single (nodes x 10) matrix-vector multiply on the board.
+'''
+import argparse
+import hashlib
+import json
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import curves
+from curves import CURVES_FILE
+
+DEFAULT_GAINS = [256] * 8 + [512, 64]
+DEFAULT_NODES = np.linspace(420, 680, 8)
+# Fine wavelength grid of the integrals in nm, as in the notebook.
+WLEN_MIN, WLEN_MAX, NWLEN = 390., 750., 1000
+# Defaults of the regularized reconstruction with all 10 channels, whose grid must cover the
+# Clear and NIR curves.
+REGULARIZED_NODES = np.linspace(400, 1000, 31)
+REGULARIZED_WLEN = (380., 1060., 2000)
+DEFAULT_LAMBDA = 0.01
+# Header of the operator tables read by lib/e4s_spectrum.py: magic, number of nodes and channels.
+OPERATOR_MAGIC = b'E4OP'
+OPERATOR_HEADER = struct.Struct('<4sHH')
+# Largest condition number of a calibration matrix that is inverted exactly.
+MAX_CONDITION = 1e6
+# Gain of the filter curves in Fig. 18 of the datasheet.
+REF_GAIN = 256
+# Bump whenever a change to this module changes the calculated matrices, to invalidate caches.
+CACHE_FORMAT = 1
+
+_memory_cache: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def basis_matrix(wlen: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """
+    Return the (len(wlen), len(nodes)) values of the piece-wise linear basis functions of the nodes,
+    so that basis.dot(node_flux) linearly interpolates (and extrapolates) node_flux to wlen.
+    """
+    nnodes = len(nodes)
+    k = np.clip(np.searchsorted(nodes, wlen, side='right') - 1, 0, nnodes - 2)
+    frac = (wlen - nodes[k]) / (nodes[k + 1] - nodes[k])
+    basis = np.zeros((len(wlen), nnodes))
+    rows = np.arange(len(wlen))
+    basis[rows, k] = 1 - frac
+    basis[rows, k + 1] = frac
+    return basis
+
+
+def filter_matrix(filters: Dict[str, List[np.ndarray]], bands: Sequence[str], gains: Sequence[float],
+                  wlen: np.ndarray) -> np.ndarray:
+    """
+    Return the (len(bands), len(wlen)) responses of each band, scaled to the reference gain.
+    """
+    names = list(filters)
+    return np.array([np.interp(wlen, *filters[band], 0., 0.) * (REF_GAIN / gains[names.index(band)])
+                     for band in bands])
+
+
+def response_matrix(filters: Dict[str, List[np.ndarray]], gains: Sequence[float] = DEFAULT_GAINS,
+                    nodes: Sequence[float] = DEFAULT_NODES, bands: Optional[Sequence[str]] = None,
+                    wlen_grid: Tuple[float, float, int] = (WLEN_MIN, WLEN_MAX, NWLEN)) -> np.ndarray:
+    """
+    Return the matrix of predicted band fluxes per unit flux at each node.
+    """
+    nodes = np.asarray(nodes, dtype=float)
+    if bands is None:
+        bands = list(filters)[:len(nodes)]
+    wlen = np.linspace(*wlen_grid)
+    # Trapezoid rule weights
+    weights = np.full(len(wlen), wlen[1] - wlen[0])
+    weights[[0, -1]] *= 0.5
+    return (filter_matrix(filters, bands, gains, wlen) * weights).dot(basis_matrix(wlen, nodes))
+
+
+def smoothness_matrix(nnodes: int) -> np.ndarray:
+    """
+    Return the (nnodes - 2, nnodes) matrix of second differences of the node fluxes.
+    """
+    return np.diff(np.eye(nnodes), n=2, axis=0)
+
+
+def regularized_operator(filters: Dict[str, List[np.ndarray]], gains: Sequence[float] = DEFAULT_GAINS,
+                         nodes: Sequence[float] = REGULARIZED_NODES, lam: float = DEFAULT_LAMBDA) -> np.ndarray:
+    """
+    Return the (len(nodes), nbands) operator from the fluxes measured in all bands to the fluxes
+    at the nodes that minimize |W (matrix . flux - measured)|^2 + lam * s * |D . flux|^2, where
+    W scales each band to unit total response, D is the smoothness matrix and s makes lam
+    independent of the number of nodes and overall flux scale.
+    """
+    matrix = response_matrix(filters, gains, nodes, list(filters), REGULARIZED_WLEN)
+    w = 1 / np.sqrt((matrix ** 2).sum(axis=1))
+    wmatrix = matrix * w[:, np.newaxis]
+    d = smoothness_matrix(len(nodes))
+    normal = wmatrix.T.dot(wmatrix)
+    dtd = d.T.dot(d)
+    s = np.trace(normal) / np.trace(dtd)
+    return np.linalg.solve(normal + lam * s * dtd, wmatrix.T) * w
+
+
+def invert(matrix: np.ndarray) -> np.ndarray:
+    """
+    Return the inverse of a calibration matrix, or raise ValueError if it is not square or is
+    (nearly) singular.
+    """
+    nbands, nnodes = matrix.shape
+    if nbands != nnodes:
+        raise ValueError(f"{nnodes} nodes need {nnodes} filter curves but only {nbands} are available; "
+                         "use fewer nodes, or --regularize")
+    if not np.linalg.cond(matrix) < MAX_CONDITION:
+        raise ValueError(f"the calibration matrix of these {nnodes} nodes is singular, e.g. because some "
+                         f"bands have no response over {WLEN_MIN:g}-{WLEN_MAX:g}nm; use fewer nodes, or --regularize")
+    return np.linalg.inv(matrix)
+
+
+def cache_key(curves_file, *params) -> str:
+    params = json.dumps([CACHE_FORMAT, curves.file_sha256(curves_file), WLEN_MIN, WLEN_MAX, NWLEN,
+                         REGULARIZED_WLEN, [np.asarray(p, dtype=float).tolist() for p in params]])
+    return hashlib.sha256(params.encode()).hexdigest()
+
+
+def get_calibration(gains: Sequence[float] = DEFAULT_GAINS, nodes: Sequence[float] = DEFAULT_NODES,
+                    curves_file=CURVES_FILE, cache_dir: Optional[Path] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return (matrix, inverse) for the gains and nodes, using the memory and cache_dir caches.
+    """
+    key = cache_key(curves_file, gains, nodes)
+    if key in _memory_cache:
+        return _memory_cache[key]
+    cached_path = Path(cache_dir) / f"calibration-{key}.npz" if cache_dir is not None else None
+    if cached_path is not None and cached_path.exists():
+        with np.load(cached_path) as cached:
+            result = cached['matrix'], cached['inverse']
+    else:
+        matrix = response_matrix(curves.load(curves_file, cache_dir), gains, nodes)
+        result = matrix, invert(matrix)
+        if cached_path is not None:
+            cached_path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(cached_path, matrix=result[0], inverse=result[1])
+    _memory_cache[key] = result
+    return result
+
+
+def get_inverse(gains: Sequence[float] = DEFAULT_GAINS, nodes: Sequence[float] = DEFAULT_NODES,
+                curves_file=CURVES_FILE, cache_dir: Optional[Path] = None) -> np.ndarray:
+    """
+    Return the matrix that transforms measured band fluxes to the fluxes at the nodes.
+    """
+    return get_calibration(gains, nodes, curves_file, cache_dir)[1]
+
+
+def get_regularized(gains: Sequence[float] = DEFAULT_GAINS, nodes: Sequence[float] = REGULARIZED_NODES,
+                    lam: float = DEFAULT_LAMBDA, curves_file=CURVES_FILE,
+                    cache_dir: Optional[Path] = None) -> np.ndarray:
+    """
+    Return regularized_operator() for the gains, nodes and lam, using the same caches as get_calibration().
+    """
+    key = cache_key(curves_file, gains, nodes, lam)
+    if key in _memory_cache:
+        return _memory_cache[key][1]
+    cached_path = Path(cache_dir) / f"regularized-{key}.npy" if cache_dir is not None else None
+    if cached_path is not None and cached_path.exists():
+        operator = np.load(cached_path)
+    else:
+        operator = regularized_operator(curves.load(curves_file, cache_dir), gains, nodes, lam)
+        if cached_path is not None:
+            cached_path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(cached_path, operator)
+    _memory_cache[key] = (np.asarray(nodes, dtype=float), operator)
+    return operator
+
+
+def save_operator(path, nodes: np.ndarray, operator: np.ndarray) -> None:
+    """
+    Save the nodes and operator as float32 tables that lib/e4s_spectrum.py reads on the board.
+    """
+    with open(path, 'wb') as f:
+        f.write(OPERATOR_HEADER.pack(OPERATOR_MAGIC, *operator.shape))
+        f.write(np.asarray(nodes, dtype='<f4').tobytes())
+        f.write(np.asarray(operator, dtype='<f4').tobytes())
+
+
+def ulab_literal(array: np.ndarray, name: str = 'inverse') -> str:
+    """
+    Return the python code of a ulab array with the values of a 2D array, as embedded in linearspec.py.
+    """
+    rows = ''.join(f"\t[{', '.join(f'{x:.5g}' for x in row)}],\n" for row in array)
+    return f'{name} = np.ndarray([\n{rows}])'
+
+
+def parse_list(text: str) -> List[float]:
+    """
+    Parse a comma-separated list where "value*count" repeats a value, e.g. "256*8,512,64".
+    """
+    values = []
+    for item in text.split(','):
+        value, _, count = item.partition('*')
+        values += [float(value)] * int(count or 1)
+    return values
+
+
+def parse_nodes(text: str) -> np.ndarray:
+    """
+    Parse "start:stop:count" as evenly spaced nodes, or a comma-separated list of wavelengths.
+    """
+    if ':' in text:
+        start, stop, count = text.split(':')
+        return np.linspace(float(start), float(stop), int(count))
+    return np.array(parse_list(text))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Print the AS7341 calibration matrix for linearspec.py.")
+    parser.add_argument("--gains", default="256*8,512,64", help="gain of each filter curve")
+    parser.add_argument("--nodes", help="node wavelengths in nm, as start:stop:count or a list "
+                        "(default 420:680:8, or 400:1000:31 with --regularize)")
+    parser.add_argument("--curves", default=str(CURVES_FILE), help="CSV file of the filter curves")
+    parser.add_argument("--cache-dir", metavar="DIR", help="reuse matrices cached in DIR")
+    parser.add_argument("--regularize", type=float, metavar="LAMBDA",
+                        help="save a regularized operator for all 10 channels instead")
+    parser.add_argument("--output", default="spectrum.bin", help="file of the regularized operator")
+    args = parser.parse_args()
+
+    try:
+        gains = parse_list(args.gains)
+        if args.nodes:
+            nodes = parse_nodes(args.nodes)
+        else:
+            nodes = DEFAULT_NODES if args.regularize is None else REGULARIZED_NODES
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    nbands = len(nodes) if args.regularize is None else len(DEFAULT_GAINS)
+    if len(gains) < nbands:
+        print(f"Error: {len(gains)} gains given for {nbands} bands", file=sys.stderr)
+        sys.exit(1)
+    try:
+        if args.regularize is None:
+            print(ulab_literal(get_inverse(gains, nodes, args.curves, args.cache_dir)))
+        else:
+            operator = get_regularized(gains, nodes, args.regularize, args.curves, args.cache_dir)
+            save_operator(args.output, nodes, operator)
+            print(f"Saved {operator.shape[0]}x{operator.shape[1]} operator to {args.output}, "
+                  f"{Path(args.output).stat().st_size} bytes")
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+'''
+Load the AS7341 filter response curves of Multispec-curves.csv, without plotting them:
+
+    import curves
+    data = curves.load()
+    x, y = data['F1_256x']
+
+The CSV file was saved by https://apps.automeris.io/wpd/ after digitizing Fig. 18 of the
+datasheet. Its first row has the name of each curve above its X column, its second row is
+"X,Y,X,Y,...", and each following row has one (X, Y) point of each curve, with empty cells once
+a curve has no more points. The whole table is parsed with a single np.genfromtxt call, with empty
+cells as NaN, then the X and Y columns of each curve are separated and trimmed.
+
+The parsed curves are saved as a compact .npz file in cache_dir (by default .cache/ next to the
+CSV file), keyed by the SHA-256 of the CSV contents, so later calls only read that file, and an
+edited CSV file is parsed again. The points of all curves are stored in two float64 arrays, with
+the names and offsets of each curve.
+
+Run this file to print a summary of the curves and the time taken with and without the cache.
+'''
+import hashlib
+import io
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+CURVES_FILE = Path(__file__).with_name("Multispec-curves.csv")
+# Bump whenever a change to this module changes the parsed curves, to invalidate caches.
+CACHE_FORMAT = 1
+
+
+def file_sha256(path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def parse(text: str) -> Dict[str, List[np.ndarray]]:
+    """
+    Parse the contents of a curves CSV file as {name: [x, y]}.
+    """
+    header, _, body = text.split('\n', 2)
+    names = header.strip().split(',')[::2]
+    ncol = 2 * len(names)
+    raw = np.genfromtxt(io.StringIO(body), delimiter=',', usecols=range(ncol), filling_values=np.nan, ndmin=2)
+    x = raw[:, 0::2].T
+    y = raw[:, 1::2].T
+    valid = ~np.isnan(x)
+    return {name: [x[k, valid[k]], y[k, valid[k]]] for k, name in enumerate(names)}
+
+
+def cache_path(cache_dir: Path, digest: str) -> Path:
+    return cache_dir / f"curves-{CACHE_FORMAT}-{digest[:32]}.npz"
+
+
+def save(path: Path, data: Dict[str, List[np.ndarray]]) -> None:
+    names = list(data)
+    offsets = np.cumsum([0] + [len(data[name][0]) for name in names])
+    tmp = path.with_name(path.name + '.tmp.npz')
+    np.savez(tmp, names=np.array(names), offsets=offsets,
+             x=np.concatenate([data[name][0] for name in names]),
+             y=np.concatenate([data[name][1] for name in names]))
+    # Rename, so that concurrent readers never see a partial file.
+    tmp.replace(path)
+
+
+def read(path: Path) -> Dict[str, List[np.ndarray]]:
+    with np.load(path) as cached:
+        names, offsets, x, y = cached['names'], cached['offsets'], cached['x'], cached['y']
+    return {str(name): [x[lo:hi], y[lo:hi]] for name, lo, hi in zip(names, offsets[:-1], offsets[1:])}
+
+
+def load(file=CURVES_FILE, cache_dir: Optional[Path] = None, use_cache: bool = True) -> Dict[str, List[np.ndarray]]:
+    """
+    Return the filter curves of file as {name: [x, y]}, in the order of the file.
+    """
+    file = Path(file)
+    with open(file, 'rb') as f:
+        contents = f.read()
+    if not use_cache:
+        return parse(contents.decode())
+    cache_dir = Path(cache_dir) if cache_dir is not None else file.parent / '.cache'
+    path = cache_path(cache_dir, hashlib.sha256(contents).hexdigest())
+    if path.exists():
+        return read(path)
+    data = parse(contents.decode())
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    save(path, data)
+    return data
+
+
+if __name__ == '__main__':
+    for use_cache in (False, True, True):
+        start = time.perf_counter()
+        data = load(use_cache=use_cache)
+        elapsed = 1e3 * (time.perf_counter() - start)
+        print(f"{'cached' if use_cache else 'parsed'}: {elapsed:.2f} ms")
+    for name, (x, y) in data.items():
+        print(f"{name:12s} {len(x):3d} points {x.min():6.1f}-{x.max():6.1f} nm, peak {y.max():.3f}")
@@ -14,6 +14,26 @@
 #  adafruit_as7341.mpy
 #  adafruit_bus_device/*
 #  adafruit_register/*
+#  e4s_telemetry.py (from the lib/ folder of https://github.com/dkirkby/E4S)
+#  e4s_spectrum.py (from the lib/ folder of https://github.com/dkirkby/E4S)
+#  e4s_autoexposure.py (from the lib/ folder of https://github.com/dkirkby/E4S)
+#
+# By default, only the 8 narrow bands are used, with the exact inverse calculated in
+# Multispec.ipynb (or calibration.py). If the file spectrum.bin, saved by
+#
+#   python calibration.py --regularize 0.01 --output spectrum.bin
+#
+# has been copied to the CIRCUITPY drive, all 10 channels are used instead to reconstruct
+# a smoother spectrum on a finer wavelength grid, with less noise.
+#
+# The gain and integration time of each reading are chosen automatically (see
+# e4s_autoexposure.py), and the fluxes are scaled back to the counts of a reading with
+# a gain of 2X and the default integration time of 281ms, which this script used before,
+# so the reconstructed spectrum has the same units as the inverse matrix below and spectrum.bin.
+#
+# Each spectrum is printed for the Mu plotter, unless the usb_cdc data port is
+# enabled in boot.py (see e4s_telemetry.py), in which case it is sent as one
+# binary frame that can be read with bin/read-telemetry.py.
 #
 # See https://github.com/adafruit/Adafruit_CircuitPython_AS7341
 # for details on the AS7341 library and examples.
@@ -43,12 +63,12 @@ i2c = busio.I2C(sda=sda, scl=scl)
 # These files are not in the base CircuitPython installation.
 # See instructions above for installing them.
 import adafruit_as7341
+from e4s_telemetry import Telemetry
+from e4s_spectrum import load_operator
+from e4s_autoexposure import AutoExposure
 
 multispec = adafruit_as7341.AS7341(i2c)
 
-# Use a low gain to avoid saturating in full sunlight.
-multispec.gain = adafruit_as7341.Gain.GAIN_2X
-
 # List the available bands.
 bands = ['415nm','445nm','480nm','515nm','555nm','590nm','630nm','680nm','clear','nir']
 nbands = len(bands)
@@ -73,28 +93,81 @@ inverse = np.ndarray([
 ])
 
 nband = 8
-band_flux = np.zeros(nband)
-linear_flux = np.zeros(nband)
 linear_wlen = np.linspace(420, 680, 8)
 
 nplot = 100
 plot_wlen = np.linspace(linear_wlen[0], linear_wlen[-1], nplot)
-plot_flux = np.zeros(nplot)
+
+# Matrix that linearly interpolates the fluxes at linear_wlen to plot_wlen,
+# i.e. np.dot(interp, linear_flux) == np.interp(plot_wlen, linear_wlen, linear_flux).
+interp = np.zeros((nplot, nband))
+for i in range(nplot):
+    k = min(nband - 2, int((plot_wlen[i] - linear_wlen[0]) / (linear_wlen[1] - linear_wlen[0])))
+    frac = (plot_wlen[i] - linear_wlen[k]) / (linear_wlen[k + 1] - linear_wlen[k])
+    interp[i, k] = 1 - frac
+    interp[i, k + 1] = frac
+
+# Scale fluxes in counts per unit gain per ms to the counts of a reading with a gain of 2X
+# and the default integration time of 281ms, the units of the inverse and spectrum.bin.
+REF_EXPOSURE = 2 * 281
 
 navg = 8
+try:
+    # Regularized reconstruction from all 10 channels.
+    plot_wlen, operator = load_operator('spectrum.bin')
+    operator *= REF_EXPOSURE / navg
+    nchannel = 10
+except OSError:
+    # Both steps are linear, so calculate the operator from measured band fluxes
+    # to plotted fluxes once, instead of applying them one after the other each time.
+    # The 1/navg of the average and the reference exposure are also included.
+    operator = np.dot(interp, inverse) * (REF_EXPOSURE / navg)
+    nchannel = nband
+
+def read_channels():
+    # Each read of all_channels measures the 8 bands with two sensor readouts,
+    # instead of a full readout for every channel_xxx read.
+    if nchannel == 8:
+        return multispec.all_channels
+    # Both readouts of all_channels also measure clear and NIR on ADC4 and ADC5, but it only
+    # returns ADC0-3, and channel_clear and channel_nir would read the sensor again. Do the
+    # same two readouts here with the library's internal methods, and keep ADC4 and ADC5 of
+    # the second one. The ADC values are the last 6 of _all_channels, which starts with a
+    # status byte in recent versions of the library.
+    multispec._configure_f1_f4()
+    low = multispec._all_channels
+    multispec._configure_f5_f8()
+    high = multispec._all_channels
+    return tuple(low[-6:-2]) + tuple(high[-6:])
+
+# Choose the gain and integration time of each reading automatically, which avoids saturating
+# in full sunlight and reads faster in bright light. Fluxes are in counts per unit gain per ms,
+# which REF_EXPOSURE, included in the operator, converts to counts.
+auto = AutoExposure(multispec, read_channels=read_channels)
+
+band_sum = np.zeros(nchannel)
+plot_flux = np.zeros(len(plot_wlen))
+
+telemetry = Telemetry()
+
+# Report the number of spectra per second every REPORT_INTERVAL seconds.
+REPORT_INTERVAL = 10
+nspectra = 0
+report_start = time.monotonic()
 while True:
-    # Calculate means of navg readings in each band.
-    band_flux[:] = 0
+    # Sum navg readings in each band.
+    band_sum[:] = 0
     for i in range(navg):
-        for j, band in enumerate(bands[:nband]):
-            band_flux[j] += getattr(multispec, 'channel_' + band)
-    band_flux /= navg
-    ##print('  band:', ','.join([f'{band_flux[i]:.3f}' for i in range(nband)]))
-    # Convert measured band fluxes to linearly interpolated fluxes.
-    linear_flux[:] = np.dot(inverse, band_flux)
-    ##print('linear:', ','.join([f'{linear_flux[i]:.3f}' for i in range(nband)]))
-    # Interpolate linear model for plotting.
-    plot_flux[:] = np.interp(plot_wlen, linear_wlen, linear_flux)
-    # Print the data to plot in the Mu Editor.
-    for j in range(nplot):
-        print((plot_flux[j],))
+        fluxes = auto.read()
+        for j in range(nchannel):
+            band_sum[j] += fluxes[j]
+    # Convert the measured band fluxes to the interpolated fluxes to plot.
+    plot_flux[:] = np.dot(operator, band_sum)
+    # Send the data to plot.
+    telemetry.send(plot_flux)
+    nspectra += 1
+    now = time.monotonic()
+    if now - report_start >= REPORT_INTERVAL:
+        print(f'{nspectra / (now - report_start):.2f} spectra/s, gain {auto.gain:g}X, {auto.time_ms:.1f}ms')
+        nspectra = 0
+        report_start = now
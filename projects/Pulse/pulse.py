@@ -18,6 +18,15 @@
 # Vcc => 3.3V
 # GND => GND
 # OUT => ADC1
+#
+# The following files must be copied to your CIRCUITPY lib/ folder:
+#
+#  e4s_capture.py (from the lib/ folder of https://github.com/dkirkby/E4S)
+#  e4s_telemetry.py (from the lib/ folder of https://github.com/dkirkby/E4S)
+#
+# The averaged response is printed for the Mu plotter, unless the usb_cdc data port is
+# enabled in boot.py (see e4s_telemetry.py), in which case it is sent as binary frames
+# that can be read with bin/read-telemetry.py.
 
 import time
 import math
@@ -26,6 +35,11 @@ import board
 import digitalio
 import analogio
 
+# These files are not in the base CircuitPython installation.
+# See instructions above for installing them.
+from e4s_capture import TriggeredCapture
+from e4s_telemetry import Telemetry
+
 speaker = digitalio.DigitalInOut(board.D13)
 speaker.direction = digitalio.Direction.OUTPUT
 speaker.value = False
@@ -34,22 +48,34 @@ speaker.value = False
 mic = analogio.AnalogIn(board.A1)
 
 ADU2VOLTS = 3.3 / 0xffff
-NSAMPLES = 100
+NPRE = 10      # samples recorded before each click
+NPOST = 100    # samples recorded from each click
+NCLICKS = 16   # clicks averaged, which reduces the noise by sqrt(NCLICKS)
+SETTLE = 0.05  # seconds to wait after each click for the speaker to settle
 
-while True:
+def click():
     speaker.value = True
     speaker.value = True # repeat to stretch out the pulse a bit
     speaker.value = False
 
-    # Record microphone samples as fast as possible.
-    start_record = time.monotonic_ns()
-    samples = [mic.value for i in range(NSAMPLES)]
-    stop_record = time.monotonic_ns()
-    duration = 1e-6 * (stop_record - start_record) # ms
+# Samples are captured into the same preallocated buffers every time, and the time of
+# each sample is measured relative to the end of the click.
+capture = TriggeredCapture(mic, NPRE, NPOST)
+
+telemetry = Telemetry()
+
+while True:
+    capture.reset()
+    for i in range(NCLICKS):
+        capture.read(click)
+        capture.accumulate()
+        time.sleep(SETTLE)
+    times_ns, waveform = capture.average()
 
-    for i in range(NSAMPLES):
-        print((samples[i] * ADU2VOLTS,))
+    # Send (time in ms, volts) of each sample of the average response.
+    telemetry.send(1e-6 * times_ns, waveform * ADU2VOLTS)
 
-    print(f'Sample duration: {duration:.1f}ms')
+    duration = 1e-6 * (times_ns[-1] - times_ns[0]) # ms
+    print(f'Sample duration: {duration:.1f}ms, average of {capture.naverage} clicks')
 
     time.sleep(1)